@@ -2,27 +2,106 @@
 StoryCrafter FastAPI Service - Vercel Deployment
 """
 
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.routing import APIRoute
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable, AsyncIterator, TYPE_CHECKING
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from functools import cached_property
+import asyncio
+import hashlib
+import time
 import os
 import sys
+import orjson
+
+if TYPE_CHECKING:
+    from storycrafter_service import VISHKARStoryCrafterService
+
+
+def _storycrafter():
+    """
+    Import the service module on first use
+
+    It pulls in the anthropic SDK, so deferring it lets health
+    checks and CORS preflights on a cold start answer without that cost.
+    """
+    import storycrafter_service
+    return storycrafter_service
+
+
+# orjson options for every response body, streamed or not
+_JSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson (backlogs are large nested dicts)"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=_JSON_OPTIONS)
+
+
+class ORJSONRequest(Request):
+    """Request whose JSON body is decoded with orjson"""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+
+class ORJSONRoute(APIRoute):
+    """Route that decodes request bodies with orjson before Pydantic validation"""
+
+    def get_route_handler(self) -> Callable[[Request], Awaitable[Response]]:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            return await handler(ORJSONRequest(request.scope, request.receive))
+
+        return route_handler
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the shared service once per worker and release its connections on shutdown"""
+    try:
+        _storycrafter().get_storycrafter_service()
+    except ValueError as e:
+        # Missing keys surface as 400s from the generation endpoints
+        print(f"[StoryCrafter] Service not initialized at startup: {e}")
+    yield
+    await _storycrafter().close_http_clients()
 
-from storycrafter_service import get_storycrafter_service, VISHKARStoryCrafterService
 
 # Initialize FastAPI app
 app = FastAPI(
     title="StoryCrafter API",
     description="AI-powered backlog generator for VISHKAR consensus discussions",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
+app.router.route_class = ORJSONRoute
+
+
+@app.exception_handler(ValueError)
+async def value_error_handler(request: Request, exc: ValueError) -> ORJSONResponse:
+    """Invalid input reported by the service -> 400"""
+    return ORJSONResponse(status_code=400, content={"detail": str(exc)})
 
 # Add CORS middleware
+# Comma-separated origin allowlist and/or a regex; both unset keeps the wildcard
+CORS_ORIGINS = [o.strip() for o in os.getenv('STORYCRAFTER_CORS_ORIGINS', '').split(',') if o.strip()]
+CORS_ORIGIN_REGEX = os.getenv('STORYCRAFTER_CORS_ORIGIN_REGEX') or None
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ORIGINS or ([] if CORS_ORIGIN_REGEX else ["*"]),
+    allow_origin_regex=CORS_ORIGIN_REGEX,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -55,7 +134,18 @@ class AIProvider(BaseModel):
     api_key: str = Field(..., description="API key for the provider")
 
 
-class GenerateBacklogRequest(BaseModel):
+class ConsensusRequest(BaseModel):
+    """Base for requests carrying consensus messages and project metadata"""
+
+    @cached_property
+    def as_dicts(self) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Consensus messages and project metadata as plain dicts, built once per request"""
+        messages = [_to_dict(msg) for msg in self.consensus_messages]
+        metadata = _to_dict(self.project_metadata) if self.project_metadata else None
+        return messages, metadata
+
+
+class GenerateBacklogRequest(ConsensusRequest):
     """Request to generate backlog from consensus"""
     consensus_messages: List[ConsensusMessage] = Field(
         ...,
@@ -68,7 +158,7 @@ class GenerateBacklogRequest(BaseModel):
     )
 
 
-class GenerateEpicsRequest(BaseModel):
+class GenerateEpicsRequest(ConsensusRequest):
     """Request to generate epic structure"""
     consensus_messages: List[ConsensusMessage] = Field(
         ...,
@@ -91,7 +181,7 @@ class EpicModel(BaseModel):
     story_count_target: Optional[int] = 4
 
 
-class GenerateStoriesRequest(BaseModel):
+class GenerateStoriesRequest(ConsensusRequest):
     """Request to generate stories for an epic"""
     epic: EpicModel = Field(..., description="Epic to generate stories for")
     consensus_messages: List[ConsensusMessage] = Field(
@@ -105,7 +195,7 @@ class GenerateStoriesRequest(BaseModel):
     )
 
 
-class RegenerateEpicRequest(BaseModel):
+class RegenerateEpicRequest(ConsensusRequest):
     """Request to regenerate an epic"""
     epic: EpicModel = Field(..., description="Original epic to regenerate")
     user_feedback: str = Field(..., description="User feedback on what to change")
@@ -135,7 +225,7 @@ class StoryModel(BaseModel):
     layer: Optional[str] = "fullstack"
 
 
-class RegenerateStoryRequest(BaseModel):
+class RegenerateStoryRequest(ConsensusRequest):
     """Request to regenerate a story"""
     epic: EpicModel = Field(..., description="Parent epic for context")
     story: StoryModel = Field(..., description="Original story to regenerate")
@@ -151,28 +241,265 @@ class RegenerateStoryRequest(BaseModel):
     )
 
 
+# ============================================================
+# HELPERS
+# ============================================================
+
+def _to_dict(model: BaseModel) -> Dict[str, Any]:
+    """Shallow dict of an already-validated model (skips model_dump's serializer pass)"""
+    return dict(model.__dict__)
+
+
+def _service_for(ai_provider: Optional[AIProvider]) -> "VISHKARStoryCrafterService":
+    """
+    Get service instance - use dynamic credentials if provided, otherwise environment variables
+    """
+    storycrafter = _storycrafter()
+    if not ai_provider:
+        # Use singleton with environment variables (backward compatibility)
+        return storycrafter.get_storycrafter_service()
+
+    # Instances are shared per set of provided credentials, so repeat callers
+    # keep their caches instead of building a new service per request
+    if ai_provider.provider == "openai":
+        return storycrafter.get_storycrafter_service(
+            anthropic_api_key=os.getenv('ANTHROPIC_API_KEY'),
+            openai_api_key=ai_provider.api_key
+        )
+
+    # Anthropic; openrouter and other providers are used as anthropic for now
+    return storycrafter.get_storycrafter_service(
+        anthropic_api_key=ai_provider.api_key,
+        openai_api_key=os.getenv('OPENAI_API_KEY')
+    )
+
+
+_timestamp: Tuple[int, str] = (0, "")
+
+
+def _utc_timestamp() -> str:
+    """Current UTC time as ISO-8601 with Z suffix, formatted at most once per second"""
+    global _timestamp
+    now = int(time.time())
+    if _timestamp[0] != now:
+        _timestamp = (now, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)))
+    return _timestamp[1]
+
+
+async def _encode_backlog_response(
+    backlog: Dict[str, Any],
+    metadata: Dict[str, Any]
+) -> AsyncIterator[bytes]:
+    """
+    Encode the /generate-backlog envelope one epic at a time
+
+    The client starts reading before the whole backlog is serialized and
+    no single buffer holds the full payload.
+    """
+    rest = orjson.dumps({k: v for k, v in backlog.items() if k != 'epics'}, option=_JSON_OPTIONS)
+    yield b'{"success":true,"backlog":' + rest[:-1] + (b',"epics":[' if len(rest) > 2 else b'"epics":[')
+
+    for i, epic in enumerate(backlog.get('epics', [])):
+        yield (b',' if i else b'') + orjson.dumps(epic, option=_JSON_OPTIONS)
+
+    yield b']},"metadata":' + orjson.dumps(metadata, option=_JSON_OPTIONS) + b'}'
+
+
+@contextmanager
+def _http_errors(operation: str):
+    """Map unexpected service errors to 500 (ValueError is left to the app-level 400 handler)"""
+    try:
+        yield
+    except ValueError:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"{operation} failed: {e}"
+        )
+
+
+# ============================================================
+# RESPONSE CACHE
+# ============================================================
+
+# Identical generation requests (client retries, double-submits) are served
+# from memory instead of re-running the LLM pipeline. TTL of 0 disables it.
+CACHE_TTL_SECONDS = float(os.getenv('STORYCRAFTER_CACHE_TTL', '300'))
+CACHE_MAX_ENTRIES = int(os.getenv('STORYCRAFTER_CACHE_MAX_ENTRIES', '128'))
+
+_response_cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+def _provider_key(ai_provider: Optional[AIProvider]) -> Optional[Tuple[str, str, str]]:
+    """
+    Provider part of a cache key. The API key is included as a digest, so a
+    result paid for with one caller's key is never served to another key.
+    """
+    if not ai_provider:
+        return None
+    key_digest = hashlib.blake2b(ai_provider.api_key.encode(), digest_size=16).hexdigest()
+    return (ai_provider.provider, ai_provider.model, key_digest)
+
+
+def _cache_key(*parts: Any) -> str:
+    """Stable digest of the inputs that determine a generation result"""
+    payload = orjson.dumps(parts, option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+async def _coalesced(key: str, produce: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run produce once for all concurrent callers with the same key
+
+    Callers arriving while a computation is in flight await its result
+    instead of starting their own. The computation runs in its own task, so
+    a caller that is cancelled (e.g. disconnects) doesn't cancel it for the
+    others. Failures are propagated to every waiter.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.ensure_future(produce())
+
+        def forget(done: asyncio.Future) -> None:
+            del _inflight[key]
+            if not done.cancelled():
+                done.exception()  # mark retrieved when nobody is left waiting
+
+        task.add_done_callback(forget)
+
+    return await asyncio.shield(task)
+
+
+async def _cached(key: str, produce: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Return the cached result for key, or produce it once and cache it
+
+    Concurrent misses are coalesced; failures are never cached.
+    """
+    entry = _response_cache.get(key)
+    if entry is not None:
+        expires_at, result = entry
+        if expires_at > time.monotonic():
+            return result
+        del _response_cache[key]
+
+    result = await _coalesced(key, produce)
+
+    if CACHE_TTL_SECONDS > 0:
+        _response_cache[key] = (time.monotonic() + CACHE_TTL_SECONDS, result)
+        while len(_response_cache) > CACHE_MAX_ENTRIES:
+            _response_cache.popitem(last=False)
+    return result
+
+
+# ============================================================
+# STORY MICRO-BATCHING
+# ============================================================
+
+# When set, /generate-stories requests for the same consensus that arrive within
+# the window are expanded in a single LLM call (0 disables batching)
+STORY_BATCH_WINDOW_MS = float(os.getenv('STORYCRAFTER_STORY_BATCH_WINDOW_MS', '0'))
+STORY_BATCH_MAX_EPICS = int(os.getenv('STORYCRAFTER_STORY_BATCH_MAX_EPICS', '4'))
+
+
+class _StoryBatch:
+    """Epics waiting to be expanded together, plus the request that opened the batch"""
+
+    def __init__(self, request: "GenerateStoriesRequest"):
+        self.request = request
+        self.pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+
+
+_story_batches: Dict[str, _StoryBatch] = {}
+_batch_tasks: set = set()
+
+
+async def _batched_stories(key: str, request: "GenerateStoriesRequest", epic: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Queue epic on the open batch for key and wait for its stories"""
+    loop = asyncio.get_running_loop()
+    batch = _story_batches.get(key)
+    if batch is None:
+        batch = _story_batches[key] = _StoryBatch(request)
+        loop.call_later(STORY_BATCH_WINDOW_MS / 1000, _flush_story_batch, key, batch)
+
+    future = loop.create_future()
+    batch.pending.append((epic, future))
+    if len(batch.pending) >= STORY_BATCH_MAX_EPICS:
+        _flush_story_batch(key, batch)
+    return await future
+
+
+def _flush_story_batch(key: str, batch: _StoryBatch) -> None:
+    """Close batch (once) and start expanding it in the background"""
+    if _story_batches.get(key) is not batch:
+        return  # already flushed when it filled up
+    del _story_batches[key]
+    task = asyncio.ensure_future(_run_story_batch(batch))
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+
+
+async def _run_story_batch(batch: _StoryBatch) -> None:
+    """Expand all epics of batch in one service call and fan results out to the waiters"""
+    messages, metadata = batch.request.as_dicts
+    try:
+        results = await _service_for(batch.request.ai_provider).generate_stories_batch(
+            epics=[epic for epic, _ in batch.pending],
+            consensus_messages=messages,
+            project_metadata=metadata
+        )
+    except asyncio.CancelledError:
+        for _, future in batch.pending:
+            future.cancel()
+        raise
+    except Exception as e:
+        for _, future in batch.pending:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    for (_, future), stories in zip(batch.pending, results):
+        if not future.done():
+            future.set_result(stories)
+
+    # Never leave a waiter hanging if the service returned fewer results than epics
+    for _, future in batch.pending[len(results):]:
+        if not future.done():
+            future.set_exception(RuntimeError("Batched story generation returned no result for this epic"))
+
+
 # ============================================================
 # ENDPOINTS
 # ============================================================
 
+# Static bodies for endpoints polled by load balancers and uptime monitors,
+# serialized once per worker
+_HEALTH_BODY = orjson.dumps({
+    "status": "healthy",
+    "service": "StoryCrafter API",
+    "version": "2.0.0"
+})
+
+_TEST_BODY = orjson.dumps({
+    "message": "StoryCrafter API is running",
+    "anthropic_key_set": bool(os.getenv('ANTHROPIC_API_KEY')),
+    "openai_key_set": bool(os.getenv('OPENAI_API_KEY')),
+    "python_version": sys.version
+})
+
+
 @app.get("/")
 async def root():
     """Root endpoint - health check"""
-    return {
-        "status": "healthy",
-        "service": "StoryCrafter API",
-        "version": "2.0.0"
-    }
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "service": "StoryCrafter API",
-        "version": "2.0.0"
-    }
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 
 @app.post("/generate-backlog")
@@ -181,50 +508,37 @@ async def generate_backlog(
     x_api_key: Optional[str] = Header(None)
 ):
     """Generate complete backlog from VISHKAR consensus discussion"""
-    try:
-        # Get service
-        service = get_storycrafter_service()
-
-        # Convert Pydantic models to dicts
-        messages = [msg.model_dump() for msg in request.consensus_messages]
-        metadata = request.project_metadata.model_dump() if request.project_metadata else None
-
-        # Generate backlog
-        backlog = await service.generate_from_consensus(
-            consensus_messages=messages,
-            project_metadata=metadata,
-            use_full_context=request.use_full_context
-        )
-
-        return {
-            "success": True,
-            "backlog": backlog,
-            "metadata": {
-                "total_epics": backlog['metadata']['total_epics'],
-                "total_stories": backlog['metadata']['total_stories'],
-                "total_estimated_hours": backlog['metadata']['total_estimated_hours'],
-                "generated_at": backlog['metadata']['generated_at']
-            }
+    with _http_errors("Backlog generation"):
+        messages, metadata = request.as_dicts
+
+        async def produce():
+            return await _service_for(None).generate_from_consensus(
+                consensus_messages=messages,
+                project_metadata=metadata,
+                use_full_context=request.use_full_context
+            )
+
+        # Generate backlog (identical retries are served from cache)
+        key = _cache_key("generate-backlog", messages, metadata, request.use_full_context)
+        backlog = await _cached(key, produce)
+
+        response_metadata = {
+            "total_epics": backlog['metadata']['total_epics'],
+            "total_stories": backlog['metadata']['total_stories'],
+            "total_estimated_hours": backlog['metadata']['total_estimated_hours'],
+            "generated_at": backlog['metadata']['generated_at']
         }
 
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Backlog generation failed: {str(e)}"
+        return StreamingResponse(
+            _encode_backlog_response(backlog, response_metadata),
+            media_type="application/json"
         )
 
 
 @app.get("/test")
 async def test_endpoint():
     """Test endpoint to verify API is running"""
-    return {
-        "message": "StoryCrafter API is running",
-        "anthropic_key_set": bool(os.getenv('ANTHROPIC_API_KEY')),
-        "openai_key_set": bool(os.getenv('OPENAI_API_KEY')),
-        "python_version": sys.version
-    }
+    return Response(content=_TEST_BODY, media_type="application/json")
 
 
 @app.post("/debug/echo")
@@ -232,7 +546,7 @@ async def debug_echo(request: dict):
     """Debug endpoint - echoes back the exact request received"""
     return {
         "received": request,
-        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "timestamp": _utc_timestamp(),
         "message": "This is what StoryCrafter received"
     }
 
@@ -243,56 +557,52 @@ async def generate_epics(
     x_api_key: Optional[str] = Header(None)
 ):
     """Generate epic structure from consensus discussion"""
-    try:
-        # Get service instance - use dynamic credentials if provided, otherwise environment variables
-        if request.ai_provider:
-            # Create fresh instance with provided credentials (bypass singleton)
-            if request.ai_provider.provider == "anthropic":
-                service = VISHKARStoryCrafterService(
-                    anthropic_api_key=request.ai_provider.api_key,
-                    openai_api_key=os.getenv('OPENAI_API_KEY')
-                )
-            elif request.ai_provider.provider == "openai":
-                service = VISHKARStoryCrafterService(
-                    anthropic_api_key=os.getenv('ANTHROPIC_API_KEY'),
-                    openai_api_key=request.ai_provider.api_key
-                )
-            else:
-                # For openrouter or other providers, use as anthropic for now
-                service = VISHKARStoryCrafterService(
-                    anthropic_api_key=request.ai_provider.api_key,
-                    openai_api_key=os.getenv('OPENAI_API_KEY')
-                )
-        else:
-            # Use singleton with environment variables (backward compatibility)
-            service = get_storycrafter_service()
-
-        # Convert Pydantic models to dicts
-        messages = [msg.model_dump() for msg in request.consensus_messages]
-        metadata = request.project_metadata.model_dump() if request.project_metadata else None
-
-        # Generate epics
-        epics = await service.generate_epics(
-            consensus_messages=messages,
-            project_metadata=metadata
-        )
+    with _http_errors("Epic generation"):
+        messages, metadata = request.as_dicts
+
+        async def produce():
+            return await _service_for(request.ai_provider).generate_epics(
+                consensus_messages=messages,
+                project_metadata=metadata
+            )
+
+        # Generate epics (identical retries are served from cache)
+        key = _cache_key("generate-epics", _provider_key(request.ai_provider), messages, metadata)
+        epics = await _cached(key, produce)
 
         return {
             "success": True,
             "epics": epics,
             "metadata": {
                 "total_epics": len(epics),
-                "generated_at": datetime.utcnow().isoformat() + "Z"
+                "generated_at": _utc_timestamp()
             }
         }
 
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Epic generation failed: {str(e)}"
-        )
+
+@app.post("/generate-epics/stream")
+async def stream_epics(
+    request: GenerateEpicsRequest,
+    x_api_key: Optional[str] = Header(None)
+):
+    """Generate epic structure, sending each epic as a server-sent event as soon as it is complete"""
+    with _http_errors("Epic generation"):
+        messages, metadata = request.as_dicts
+        service = _service_for(request.ai_provider)
+
+    async def events() -> AsyncIterator[bytes]:
+        total = 0
+        try:
+            async for epic in service.stream_epics(consensus_messages=messages, project_metadata=metadata):
+                total += 1
+                yield b"event: epic\ndata: " + orjson.dumps(epic) + b"\n\n"
+        except Exception as e:
+            # Headers are already sent; report the failure in-band
+            yield b"event: error\ndata: " + orjson.dumps({"detail": f"Epic generation failed: {e}"}) + b"\n\n"
+            return
+        yield b"event: done\ndata: " + orjson.dumps({"total_epics": total, "generated_at": _utc_timestamp()}) + b"\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 
 @app.post("/generate-stories")
@@ -301,41 +611,23 @@ async def generate_stories(
     x_api_key: Optional[str] = Header(None)
 ):
     """Generate stories for a specific epic"""
-    try:
-        # Get service instance - use dynamic credentials if provided, otherwise environment variables
-        if request.ai_provider:
-            # Create fresh instance with provided credentials (bypass singleton)
-            if request.ai_provider.provider == "anthropic":
-                service = VISHKARStoryCrafterService(
-                    anthropic_api_key=request.ai_provider.api_key,
-                    openai_api_key=os.getenv('OPENAI_API_KEY')
-                )
-            elif request.ai_provider.provider == "openai":
-                service = VISHKARStoryCrafterService(
-                    anthropic_api_key=os.getenv('ANTHROPIC_API_KEY'),
-                    openai_api_key=request.ai_provider.api_key
-                )
-            else:
-                # For openrouter or other providers, use as anthropic for now
-                service = VISHKARStoryCrafterService(
-                    anthropic_api_key=request.ai_provider.api_key,
-                    openai_api_key=os.getenv('OPENAI_API_KEY')
-                )
-        else:
-            # Use singleton with environment variables (backward compatibility)
-            service = get_storycrafter_service()
-
-        # Convert Pydantic models to dicts
-        epic = request.epic.model_dump()
-        messages = [msg.model_dump() for msg in request.consensus_messages]
-        metadata = request.project_metadata.model_dump() if request.project_metadata else None
-
-        # Generate stories
-        stories = await service.generate_stories(
-            epic=epic,
-            consensus_messages=messages,
-            project_metadata=metadata
-        )
+    with _http_errors("Story generation"):
+        epic = _to_dict(request.epic)
+        messages, metadata = request.as_dicts
+
+        async def produce():
+            if STORY_BATCH_WINDOW_MS > 0:
+                batch_key = _cache_key("story-batch", _provider_key(request.ai_provider), messages, metadata)
+                return await _batched_stories(batch_key, request, epic)
+            return await _service_for(request.ai_provider).generate_stories(
+                epic=epic,
+                consensus_messages=messages,
+                project_metadata=metadata
+            )
+
+        # Generate stories (concurrent duplicates share one generation)
+        key = _cache_key("generate-stories", _provider_key(request.ai_provider), epic, messages, metadata)
+        stories = await _coalesced(key, produce)
 
         return {
             "success": True,
@@ -343,18 +635,10 @@ async def generate_stories(
             "metadata": {
                 "epic_id": epic.get('id'),
                 "total_stories": len(stories),
-                "generated_at": datetime.utcnow().isoformat() + "Z"
+                "generated_at": _utc_timestamp()
             }
         }
 
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Story generation failed: {str(e)}"
-        )
-
 
 @app.post("/regenerate-epic")
 async def regenerate_epic(
@@ -362,59 +646,33 @@ async def regenerate_epic(
     x_api_key: Optional[str] = Header(None)
 ):
     """Regenerate an epic based on user feedback"""
-    try:
-        # Get service instance - use dynamic credentials if provided, otherwise environment variables
-        if request.ai_provider:
-            # Create fresh instance with provided credentials (bypass singleton)
-            if request.ai_provider.provider == "anthropic":
-                service = VISHKARStoryCrafterService(
-                    anthropic_api_key=request.ai_provider.api_key,
-                    openai_api_key=os.getenv('OPENAI_API_KEY')
-                )
-            elif request.ai_provider.provider == "openai":
-                service = VISHKARStoryCrafterService(
-                    anthropic_api_key=os.getenv('ANTHROPIC_API_KEY'),
-                    openai_api_key=request.ai_provider.api_key
-                )
-            else:
-                # For openrouter or other providers, use as anthropic for now
-                service = VISHKARStoryCrafterService(
-                    anthropic_api_key=request.ai_provider.api_key,
-                    openai_api_key=os.getenv('OPENAI_API_KEY')
-                )
-        else:
-            # Use singleton with environment variables (backward compatibility)
-            service = get_storycrafter_service()
-
-        # Convert Pydantic models to dicts
-        epic = request.epic.model_dump()
-        messages = [msg.model_dump() for msg in request.consensus_messages]
-        metadata = request.project_metadata.model_dump() if request.project_metadata else None
-
-        # Regenerate epic
-        regenerated_epic = await service.regenerate_epic(
-            epic=epic,
-            user_feedback=request.user_feedback,
-            consensus_messages=messages,
-            project_metadata=metadata
+    with _http_errors("Epic regeneration"):
+        epic = _to_dict(request.epic)
+        messages, metadata = request.as_dicts
+
+        async def produce():
+            return await _service_for(request.ai_provider).regenerate_epic(
+                epic=epic,
+                user_feedback=request.user_feedback,
+                consensus_messages=messages,
+                project_metadata=metadata
+            )
+
+        # Regenerate epic (concurrent duplicates share one regeneration)
+        key = _cache_key(
+            "regenerate-epic", _provider_key(request.ai_provider),
+            epic, request.user_feedback, messages, metadata
         )
+        regenerated_epic = await _coalesced(key, produce)
 
         return {
             "success": True,
             "epic": regenerated_epic,
             "metadata": {
-                "regenerated_at": datetime.utcnow().isoformat() + "Z"
+                "regenerated_at": _utc_timestamp()
             }
         }
 
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Epic regeneration failed: {str(e)}"
-        )
-
 
 @app.post("/regenerate-story")
 async def regenerate_story(
@@ -422,57 +680,46 @@ async def regenerate_story(
     x_api_key: Optional[str] = Header(None)
 ):
     """Regenerate a story based on user feedback"""
-    try:
-        # Get service instance - use dynamic credentials if provided, otherwise environment variables
-        if request.ai_provider:
-            # Create fresh instance with provided credentials (bypass singleton)
-            if request.ai_provider.provider == "anthropic":
-                service = VISHKARStoryCrafterService(
-                    anthropic_api_key=request.ai_provider.api_key,
-                    openai_api_key=os.getenv('OPENAI_API_KEY')
-                )
-            elif request.ai_provider.provider == "openai":
-                service = VISHKARStoryCrafterService(
-                    anthropic_api_key=os.getenv('ANTHROPIC_API_KEY'),
-                    openai_api_key=request.ai_provider.api_key
-                )
-            else:
-                # For openrouter or other providers, use as anthropic for now
-                service = VISHKARStoryCrafterService(
-                    anthropic_api_key=request.ai_provider.api_key,
-                    openai_api_key=os.getenv('OPENAI_API_KEY')
-                )
-        else:
-            # Use singleton with environment variables (backward compatibility)
-            service = get_storycrafter_service()
-
-        # Convert Pydantic models to dicts
-        epic = request.epic.model_dump()
-        story = request.story.model_dump()
-        messages = [msg.model_dump() for msg in request.consensus_messages]
-        metadata = request.project_metadata.model_dump() if request.project_metadata else None
-
-        # Regenerate story
-        regenerated_story = await service.regenerate_story(
-            epic=epic,
-            story=story,
-            user_feedback=request.user_feedback,
-            consensus_messages=messages,
-            project_metadata=metadata
+    with _http_errors("Story regeneration"):
+        epic = _to_dict(request.epic)
+        story = _to_dict(request.story)
+        messages, metadata = request.as_dicts
+
+        async def produce():
+            return await _service_for(request.ai_provider).regenerate_story(
+                epic=epic,
+                story=story,
+                user_feedback=request.user_feedback,
+                consensus_messages=messages,
+                project_metadata=metadata
+            )
+
+        # Regenerate story (concurrent duplicates share one regeneration)
+        key = _cache_key(
+            "regenerate-story", _provider_key(request.ai_provider),
+            epic, story, request.user_feedback, messages, metadata
         )
+        regenerated_story = await _coalesced(key, produce)
 
         return {
             "success": True,
             "story": regenerated_story,
             "metadata": {
-                "regenerated_at": datetime.utcnow().isoformat() + "Z"
+                "regenerated_at": _utc_timestamp()
             }
         }
 
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Story regeneration failed: {str(e)}"
-        )
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # Local / self-hosted run (Vercel serves `app` directly). uvicorn's "auto"
+    # loop and HTTP parser pick uvloop and httptools when uvicorn[standard]
+    # is installed; access logging is off to keep it out of the request path.
+    uvicorn.run(
+        "index:app",
+        host="0.0.0.0",
+        port=int(os.getenv('PORT', '8000')),
+        workers=int(os.getenv('STORYCRAFTER_WORKERS', '1')),
+        access_log=False
+    )
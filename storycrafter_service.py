@@ -5,14 +5,499 @@ Transforms 3-agent consensus discussions into comprehensive project backlogs
 Part of the Prometheus Framework
 """
 
-from typing import List, Dict, Any
-from datetime import datetime
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable, Optional, Tuple
+from collections import OrderedDict
+from itertools import chain
+from dataclasses import dataclass
+from functools import lru_cache
 import anthropic
-import openai
+import orjson
 import json
 import re
 import os
 import asyncio
+import hashlib
+import string
+import bisect
+import random
+import time
+
+
+# Requirement extraction patterns (legacy mode), compiled once at import
+_PROJECT_NAME_PATTERNS = [
+    re.compile(r'Project:\s*([^\n]+)', re.IGNORECASE),
+    re.compile(r'Project Name:\s*([^\n]+)', re.IGNORECASE),
+    re.compile(r'Building\s+(?:a|an)\s+([^\n]+)', re.IGNORECASE),
+]
+_NUMBERED_ITEM_RE = re.compile(r'^\d+\.')
+_LIST_MARKER_RE = re.compile(r'^[-*•\d.]\s*')
+_TIMELINE_RE = re.compile(r'(\d+(?:-\d+)?)\s+(week|month)s?', re.IGNORECASE)
+_TEAM_SIZE_RE = re.compile(r'(\d+(?:-\d+)?)\s+(?:developer|dev)s?', re.IGNORECASE)
+_TECH_KEYWORDS = ('frontend', 'backend', 'database', 'framework', 'library')
+# Every keyword _extract_requirements dispatches on, found in one pass per
+# message (lookahead so adjacent/overlapping keywords are all reported)
+_REQUIREMENT_KEYWORDS_RE = re.compile(
+    r'(?=(mvp|core feature|frontend|backend|database|framework|library|week|month|developer|team))'
+)
+_TECH_STACK_PATTERNS = {
+    keyword: [
+        re.compile(rf'{keyword}:\s*([^\n,]+)', re.IGNORECASE),
+        re.compile(rf'{keyword}\s+(?:using|with)\s+([^\n,]+)', re.IGNORECASE),
+    ]
+    for keyword in _TECH_KEYWORDS
+}
+
+# Retries of a single LLM call on transient API errors, on top of the SDK's
+# own retries: exponential backoff with full jitter
+_RETRY_ATTEMPTS = 4
+_RETRY_BASE_DELAY = 0.5
+_RETRY_MAX_DELAY = 8.0
+
+
+def _is_transient_api_error(error: Exception) -> bool:
+    """Rate limits, overload/5xx responses and connection failures are worth retrying"""
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+async def _retry_transient(operation: Callable[[], Awaitable[Any]], label: str) -> Any:
+    """Await operation(), retrying transient API errors with backoff"""
+    for attempt in range(1, _RETRY_ATTEMPTS + 1):
+        try:
+            return await operation()
+        except Exception as e:
+            if attempt == _RETRY_ATTEMPTS or not _is_transient_api_error(e):
+                raise
+            delay = random.uniform(0, min(_RETRY_MAX_DELAY, _RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+            print(f"[StoryCrafter]   {label} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+# Consensus context layout (see _build_full_consensus_context) and a rough
+# token estimate for trimming it to a budget without a tokenizer
+_DISCUSSION_HEADER = "### 3-AGENT CONSENSUS DISCUSSION\n"
+_CHARS_PER_TOKEN = 4
+
+
+class _ConsensusContext(str):
+    """
+    Consensus context text that remembers where each message block starts,
+    so it can be trimmed on message boundaries. Messages are written by LLM
+    agents and often contain their own markdown headings, so the boundaries
+    can't be recovered by searching the text.
+    """
+    message_starts: Tuple[int, ...] = ()
+
+
+def _fit_context(full_context: str, max_tokens: int) -> str:
+    """
+    Trim the consensus context to about max_tokens on message boundaries
+
+    Keeps the project overview and the most recent messages whole, dropping
+    the oldest messages first. Only a context whose overview and last message
+    alone exceed the budget (or plain text without message boundaries) is cut
+    mid-text, keeping its end from a line break.
+    """
+    return _fit_messages(full_context, getattr(full_context, 'message_starts', ()), max_tokens)
+
+
+@lru_cache(maxsize=32)
+def _fit_messages(full_context: str, message_starts: Tuple[int, ...], max_tokens: int) -> str:
+    """_fit_context for known message start offsets, cached by content and budget"""
+    max_chars = max_tokens * _CHARS_PER_TOKEN
+    if len(full_context) <= max_chars:
+        return full_context
+
+    if message_starts:
+        prefix_end = message_starts[0] - 1  # through the discussion header
+        budget = max_chars - prefix_end - 40  # room for the omission note
+
+        # First message from which the rest of the discussion fits
+        omitted = bisect.bisect_left(message_starts, len(full_context) - budget)
+        if omitted < len(message_starts):
+            return (f"{full_context[:prefix_end]}\n({omitted} earlier messages omitted)\n\n"
+                    f"{full_context[message_starts[omitted]:]}")
+
+    start = len(full_context) - max_chars
+    line_start = full_context.find("\n", start) + 1
+    return full_context[line_start if line_start > 0 else start:]
+
+
+# Connection pools shared by every service instance (including ones built for
+# per-request API keys), so LLM calls reuse warm TLS connections
+_http_clients: Dict[str, Any] = {}
+
+
+def _shared_http_client(sdk) -> Any:
+    """Get the shared HTTP client for an SDK module (anthropic or openai)"""
+    client = _http_clients.get(sdk.__name__)
+
+    if client is None or client.is_closed:
+        # Bounded pool sized for the epic fan-out; with HTTP/2 (needs the h2
+        # package) concurrent calls multiplex over one connection
+        max_connections = int(os.getenv('STORYCRAFTER_HTTP_MAX_CONNECTIONS', '32'))
+        client = _http_clients[sdk.__name__] = sdk.DefaultAsyncHttpxClient(
+            http2=os.getenv('STORYCRAFTER_HTTP2', '0') == '1',
+            limits=type(sdk.DEFAULT_CONNECTION_LIMITS)(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            )
+        )
+
+    return client
+
+
+async def close_http_clients() -> None:
+    """Close the shared HTTP clients (call on application shutdown)"""
+    for client in _http_clients.values():
+        await client.aclose()
+
+
+def _content_key(*parts: Any) -> str:
+    """Stable digest of JSON-serializable parts, for keying caches by content"""
+    payload = orjson.dumps(parts, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+@dataclass(frozen=True)
+class BacklogSession:
+    """
+    Consensus context prepared once and reused across generate/regenerate calls
+
+    Build with VISHKARStoryCrafterService.build_session and pass as session=
+    instead of consensus_messages/project_metadata.
+    """
+    full_context: str
+    context_key: str
+    project_metadata: Optional[Dict[str, Any]]
+    message_count: int
+
+
+def _cached_text_block(text: str) -> Dict[str, Any]:
+    """Prompt content block Anthropic may serve from its prompt cache on repeat calls"""
+    return {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+
+
+# Acceptance criterion quality indicators, one named group per indicator.
+# Given-When-Then only needs all three words somewhere in one criterion, so it
+# is a zero-width set of lookaheads at the start of each criterion. Criteria
+# are scanned as one text joined on _AC_SEPARATOR, which the lookaheads don't cross.
+_AC_SEPARATOR = "\x00"
+_AC_QUALITY_RE = re.compile(
+    r'(?P<has_given_when_then>(?:\A|(?<=\x00))(?=[^\x00]*?given)(?=[^\x00]*?when)(?=[^\x00]*?then))'
+    r'|(?P<has_edge_cases>edge case|error|failure)'
+    r'|(?P<has_non_functional>performance|security|usability|accessibility|non-functional)'
+    r'|(?P<has_specific_validation>validate|verify)',
+    re.IGNORECASE | re.DOTALL
+)
+
+
+@lru_cache(maxsize=4096)
+def _ac_quality_found(acceptance_criteria: tuple) -> frozenset:
+    """Names of the quality indicators present in the criteria, cached by content"""
+    found = set()
+    for match in _AC_QUALITY_RE.finditer(_AC_SEPARATOR.join(acceptance_criteria)):
+        found.add(match.lastgroup)
+        if len(found) == len(_AC_QUALITY_RE.groupindex):
+            break
+    return frozenset(found)
+
+
+# Acceptance criteria warning codes and their log messages
+WARN_TOO_FEW = "too_few"
+WARN_TOO_MANY = "too_many"
+WARN_LOW_QUALITY = "low_quality"
+_WARNING_MESSAGES = {
+    WARN_TOO_FEW: "Story {story_id}: Less than 4 acceptance criteria (found {count})",
+    WARN_TOO_MANY: "Story {story_id}: More than 10 criteria may be too granular (found {count})",
+    WARN_LOW_QUALITY: (
+        "Story {story_id}: Low quality score ({score}/4). "
+        "Consider adding Given-When-Then format, edge cases, or non-functional requirements."
+    ),
+}
+
+
+# Tool the single-shot backlog call must answer with, so the whole backlog
+# (epics with their stories) comes back as one structured object
+_STRING_LIST_SCHEMA = {"type": "array", "items": {"type": "string"}}
+_SUBMIT_BACKLOG_TOOL = {
+    "name": "submit_backlog",
+    "description": "Submit the complete project backlog: every epic with its user stories.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "epics": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "string"},
+                        "title": {"type": "string"},
+                        "description": {"type": "string"},
+                        "priority": {"type": "string", "enum": ["High", "Medium", "Low"]},
+                        "category": {"type": "string", "enum": ["MVP", "Post-MVP", "Technical"]},
+                        "stories": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "id": {"type": "string"},
+                                    "title": {"type": "string"},
+                                    "description": {"type": "string"},
+                                    "acceptance_criteria": _STRING_LIST_SCHEMA,
+                                    "technical_tasks": _STRING_LIST_SCHEMA,
+                                    "priority": {"type": "string"},
+                                    "story_points": {"type": "integer"},
+                                    "estimated_hours": {"type": "number"},
+                                    "dependencies": _STRING_LIST_SCHEMA,
+                                    "tags": _STRING_LIST_SCHEMA,
+                                    "layer": {"type": "string"}
+                                },
+                                "required": ["id", "title", "description", "acceptance_criteria"]
+                            }
+                        }
+                    },
+                    "required": ["id", "title", "description", "stories"]
+                }
+            }
+        },
+        "required": ["epics"]
+    }
+}
+
+# Markdown code fence (optionally ```json) around a model's JSON payload
+_CODE_FENCE_RE = re.compile(r'\A\s*```(?:json)?\s*(.*?)\s*(?:```|\Z)', re.DOTALL)
+
+
+def _strip_code_fence(text: str) -> str:
+    """Return the JSON payload of a model response, without any surrounding code fence"""
+    match = _CODE_FENCE_RE.match(text)
+    return match.group(1) if match else text.strip()
+
+
+_ARRAY_SEPARATOR_RE = re.compile(r'[\s,]*')
+_json_decoder = json.JSONDecoder()
+
+
+class _JSONArrayStream:
+    """Decode the items of a top-level JSON array incrementally from text chunks"""
+
+    def __init__(self):
+        self._buffer = ""
+        self._started = False
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Add a chunk and return the items completed by it"""
+        self._buffer += chunk
+        items = []
+
+        if not self._started:
+            # Skip anything before the array (e.g. a ```json fence)
+            start = self._buffer.find('[')
+            if start < 0:
+                return items
+            self._buffer = self._buffer[start + 1:]
+            self._started = True
+
+        while not self.done:
+            pos = _ARRAY_SEPARATOR_RE.match(self._buffer).end()
+            if pos == len(self._buffer):
+                break
+            if self._buffer[pos] == ']':
+                self.done = True
+                break
+            try:
+                item, end = _json_decoder.raw_decode(self._buffer, pos)
+            except json.JSONDecodeError:
+                break  # item not complete yet
+            items.append(item)
+            self._buffer = self._buffer[end:]
+
+        return items
+
+
+def _parse_json_array(text: str) -> List[Any]:
+    """Parse a model's JSON array, recovering the items if the array is wrapped in prose or an object"""
+    try:
+        parsed = orjson.loads(text)
+    except orjson.JSONDecodeError:
+        stream = _JSONArrayStream()
+        items = stream.feed(text)
+        if not stream.done:
+            raise
+        return items
+    if isinstance(parsed, dict) and isinstance(parsed.get('stories'), list):
+        return parsed['stories']
+    return parsed
+
+
+class _LRUCache:
+    """Small least-recently-used cache with a fixed number of entries and optional TTL"""
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+# Static parts of the regeneration prompts; only the epic/story fields,
+# feedback and context are filled in per call. The instructions go in the
+# system prompt and the project context comes first in the user turn, so
+# regenerations for the same project share a cacheable prefix.
+_EPIC_REGEN_SYSTEM = "You are an expert Agile Product Owner creating project epics."
+
+_EPIC_REGEN_TAIL = string.Template("""
+
+## TASK
+
+Based on the user feedback, generate an IMPROVED VERSION of this epic.
+
+The regenerated epic should:
+1. Address all points raised in the user feedback
+2. Maintain the same ID: $id
+3. Keep the same general scope unless feedback suggests otherwise
+4. Have an improved title and description
+5. Maintain consistency with the project context
+
+## OUTPUT FORMAT
+
+Return a JSON object for the regenerated epic:
+
+{
+  "id": "$id",
+  "title": "Improved Epic Title",
+  "description": "Enhanced epic description (2-3 sentences)",
+  "priority": "High|Medium|Low",
+  "category": "MVP|Post-MVP|Technical",
+  "story_count_target": 4,
+  "regeneration_notes": "Brief note on what was changed based on feedback"
+}
+
+Generate JSON only, no markdown:""")
+
+_STORY_REGEN_SYSTEM = "You are an expert Agile Product Owner creating user stories."
+
+_STORY_REGEN_TAIL = string.Template("""
+
+## TASK
+
+Generate an IMPROVED VERSION addressing the feedback.
+
+Include:
+- "As a [persona], I want [goal], so that [benefit]" format
+- 5-7 DETAILED acceptance criteria (use Given-When-Then format, include edge cases, non-functional requirements)
+- 4-7 detailed technical tasks
+- Realistic story points and hours
+
+## OUTPUT FORMAT
+
+JSON object:
+
+{
+  "id": "$id",
+  "title": "Improved Title",
+  "description": "As a [persona], I want [goal], so that [benefit]",
+  "acceptance_criteria": [
+    "GIVEN [precondition] WHEN [action] THEN [expected result]",
+    "System validates [specific condition] and provides [specific feedback]",
+    "User can [specific action] within [performance constraint]",
+    "[Edge case]: System handles [error scenario] by [expected behavior]",
+    "[Non-functional]: [Performance/security/usability requirement]",
+    "Additional detailed testable criterion"
+  ],
+  "technical_tasks": ["Task 1", "Task 2", "Task 3", "Task 4", "Task 5"],
+  "priority": "P0",
+  "story_points": 5,
+  "estimated_hours": 10,
+  "dependencies": [],
+  "tags": ["mvp", "backend"],
+  "layer": "fullstack",
+  "regeneration_notes": "Changes made based on feedback"
+}
+
+JSON only:""")
+
+# The deprecated GPT-5 story regeneration keeps its own, more detailed prompt
+_GPT5_STORY_REGEN_SYSTEM = """You are an expert Agile Product Owner and Technical Architect with 15+ years of experience.
+You create comprehensive, production-ready user stories with detailed acceptance criteria and technical implementation tasks.
+Your stories are clear, actionable, and follow industry best practices."""
+
+_GPT5_STORY_REGEN_TAIL = string.Template("""
+
+## TASK
+
+Generate an IMPROVED VERSION of this story that addresses the user feedback.
+
+The regenerated story should:
+1. Address all points raised in the user feedback
+2. Maintain the same ID: $id
+3. Follow proper format: "As a [persona], I want [goal], so that [benefit]"
+4. Include 5-7 DETAILED acceptance criteria using:
+   - Given-When-Then format where applicable
+   - Specific, testable, and measurable conditions
+   - Edge cases and error scenarios
+   - Non-functional requirements (performance, security, usability)
+5. List 4-7 detailed technical implementation tasks
+6. Assign realistic story points (2, 3, 5, or 8)
+7. Estimate hours appropriately
+8. Identify dependencies if applicable
+9. Add relevant tags (mvp, backend, frontend, etc.)
+10. Specify layer (fullstack, backend, frontend, database, or infrastructure)
+
+## OUTPUT FORMAT
+
+Return a JSON object for the regenerated story. CRITICAL: Output ONLY valid JSON, no markdown:
+
+{
+  "id": "$id",
+  "title": "Improved Story Title",
+  "description": "As a [persona], I want [goal], so that [benefit]",
+  "acceptance_criteria": [
+    "GIVEN [precondition] WHEN [action] THEN [expected result]",
+    "System validates [specific condition] and provides [specific feedback]",
+    "User can successfully [specific action] within [performance constraint]",
+    "[Edge case]: System handles [error scenario] by [expected behavior]",
+    "[Non-functional]: [Performance/security/usability requirement met]",
+    "Additional detailed testable criterion 6"
+  ],
+  "technical_tasks": [
+    "Improved implementation task 1",
+    "Improved implementation task 2",
+    "Improved implementation task 3",
+    "Improved implementation task 4",
+    "Improved implementation task 5",
+    "Testing task 6"
+  ],
+  "priority": "P0",
+  "story_points": 5,
+  "estimated_hours": 10,
+  "dependencies": [],
+  "tags": ["mvp", "backend", "frontend"],
+  "layer": "fullstack",
+  "regeneration_notes": "Brief note on what was changed based on feedback"
+}
+
+Generate JSON only, no markdown code blocks:""")
 
 
 class VISHKARStoryCrafterService:
@@ -35,13 +520,12 @@ class VISHKARStoryCrafterService:
         anthropic_key = anthropic_api_key or os.getenv('ANTHROPIC_API_KEY')
         if not anthropic_key:
             raise ValueError("ANTHROPIC_API_KEY must be provided or set in environment")
-        self.anthropic_client = anthropic.Anthropic(api_key=anthropic_key)
+        self.anthropic_client = anthropic.AsyncAnthropic(api_key=anthropic_key, http_client=_shared_http_client(anthropic))
 
-        # Initialize OpenAI (for story generation with GPT-5)
-        openai_key = openai_api_key or os.getenv('OPENAI_API_KEY')
-        if not openai_key:
-            raise ValueError("OPENAI_API_KEY must be provided or set in environment")
-        self.openai_client = openai.OpenAI(api_key=openai_key)
+        # OpenAI is only used by the deprecated GPT-5 story regeneration path,
+        # so its key is optional and the client is created on first use
+        self._openai_key = openai_api_key or os.getenv('OPENAI_API_KEY')
+        self._openai_client = None
 
         # Model configurations
         self.claude_model = os.getenv('STORYCRAFTER_CLAUDE_MODEL', 'claude-sonnet-4-20250514')
@@ -50,6 +534,38 @@ class VISHKARStoryCrafterService:
         self.gpt_max_tokens = int(os.getenv('STORYCRAFTER_GPT_MAX_TOKENS', '128000'))
         self.temperature = float(os.getenv('STORYCRAFTER_TEMPERATURE', '0.5'))
 
+        # Try generating the whole backlog in one structured call before
+        # falling back to the two-phase (epics, then stories per epic) flow
+        self.single_shot = os.getenv('STORYCRAFTER_SINGLE_SHOT', '0') == '1'
+
+        # Replace verbatim repeats of earlier consensus messages with a short
+        # reference before they are sent to the model
+        self.dedup_messages = os.getenv('STORYCRAFTER_DEDUP', '0') == '1'
+
+        # Max concurrent LLM calls when expanding epics in parallel
+        self.max_concurrency = int(os.getenv('STORYCRAFTER_MAX_CONCURRENCY', '8'))
+
+        # Approximate token budget for the consensus context in story prompts
+        self.story_context_tokens = int(os.getenv('STORYCRAFTER_STORY_CONTEXT_TOKENS', '4000'))
+
+        # Sessions (formatted consensus context) by content key; the same
+        # discussion is formatted again for every epic/story call made against it
+        self._context_cache = _LRUCache(maxsize=32)
+
+        # Raw story responses by prompt; only used when temperature is 0, where
+        # an identical prompt is expected to produce the same stories
+        self._story_cache = _LRUCache(maxsize=1024, ttl=3600)
+
+    @property
+    def openai_client(self):
+        """OpenAI client, created on first use"""
+        if self._openai_client is None:
+            if not self._openai_key:
+                raise ValueError("OPENAI_API_KEY must be provided or set in environment")
+            import openai
+            self._openai_client = openai.AsyncOpenAI(api_key=self._openai_key, http_client=_shared_http_client(openai))
+        return self._openai_client
+
     # ============================================================
     # PUBLIC API
     # ============================================================
@@ -75,17 +591,17 @@ class VISHKARStoryCrafterService:
         print(f"[StoryCrafter] Starting backlog generation from {len(consensus_messages)} messages")
         print(f"[StoryCrafter] Mode: {'FULL CONTEXT' if use_full_context else 'REQUIREMENTS EXTRACTION'}")
 
-        # Step 1: Extract requirements for metadata (always needed)
-        requirements = self._extract_requirements(consensus_messages, project_metadata)
-
-        # Step 2: Generate backlog using Claude API
+        # Step 1 + 2: Generate backlog using Claude API
         if use_full_context:
             # NEW APPROACH: Pass full consensus directly to Claude
+            # (no requirements extraction - nothing downstream reads it)
             print("[StoryCrafter] Using enhanced full-context generation")
+            requirements = None
             raw_backlog = await self._generate_with_full_context(consensus_messages, project_metadata)
         else:
             # OLD APPROACH: Use extracted requirements
             print("[StoryCrafter] Using legacy requirements extraction")
+            requirements = self._extract_requirements(consensus_messages, project_metadata)
             raw_backlog = await self._generate_backlog_with_claude(requirements)
 
         # Step 3: Validate and parse JSON
@@ -109,10 +625,38 @@ class VISHKARStoryCrafterService:
 
         return vishkar_format
 
-    async def generate_epics(
+    def build_session(
         self,
         consensus_messages: List[Dict[str, str]],
         project_metadata: Dict[str, Any] = None
+    ) -> BacklogSession:
+        """
+        PUBLIC API: Prepare the consensus context once for several generate/regenerate calls
+
+        Args:
+            consensus_messages: List of messages from 3-agent discussion
+            project_metadata: Optional project metadata
+
+        Returns:
+            BacklogSession to pass as session= to the other public methods
+        """
+        context_key = _content_key(consensus_messages, project_metadata, self.dedup_messages)
+        session = self._context_cache.get(context_key)
+        if session is None:
+            session = BacklogSession(
+                full_context=self._build_full_consensus_context(consensus_messages, project_metadata),
+                context_key=context_key,
+                project_metadata=project_metadata,
+                message_count=len(consensus_messages)
+            )
+            self._context_cache.put(context_key, session)
+        return session
+
+    async def generate_epics(
+        self,
+        consensus_messages: List[Dict[str, str]] = None,
+        project_metadata: Dict[str, Any] = None,
+        session: BacklogSession = None
     ) -> List[Dict[str, Any]]:
         """
         PUBLIC API: Generate epic structure from consensus messages
@@ -120,23 +664,66 @@ class VISHKARStoryCrafterService:
         Args:
             consensus_messages: List of messages from 3-agent discussion
             project_metadata: Optional project metadata
+            session: Context from build_session, instead of consensus_messages/project_metadata
 
         Returns:
             List of epic objects (without stories)
         """
-        print(f"[StoryCrafter] Generating epics from {len(consensus_messages)} messages")
-
-        full_context = self._format_full_consensus_for_prompt(consensus_messages, project_metadata)
+        session = self._session_for(consensus_messages, project_metadata, session)
+        full_context, project_metadata = session.full_context, session.project_metadata
+        print(f"[StoryCrafter] Generating epics from {session.message_count} messages")
         epics_list = await self._generate_epic_structure(full_context, project_metadata)
 
         print(f"[StoryCrafter] Generated {len(epics_list)} epics")
         return epics_list
 
+    async def stream_epics(
+        self,
+        consensus_messages: List[Dict[str, str]] = None,
+        project_metadata: Dict[str, Any] = None,
+        session: BacklogSession = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        PUBLIC API: Generate epic structure, yielding each epic as soon as it is complete
+
+        Args:
+            consensus_messages: List of messages from 3-agent discussion
+            project_metadata: Optional project metadata
+            session: Context from build_session, instead of consensus_messages/project_metadata
+
+        Yields:
+            Epic objects (without stories), in generation order; ValueError if
+            the reply ends before the epic array is complete
+        """
+        session = self._session_for(consensus_messages, project_metadata, session)
+        full_context, project_metadata = session.full_context, session.project_metadata
+        print(f"[StoryCrafter] Streaming epics from {session.message_count} messages")
+        prompt = self._build_epic_structure_prompt(full_context)
+        epics = _JSONArrayStream()
+        total = 0
+
+        async for text in self._stream_text(
+            model=self.claude_model,
+            max_tokens=4096,
+            temperature=self.temperature,
+            messages=[{"role": "user", "content": [_cached_text_block(prompt)]}]
+        ):
+            for epic in epics.feed(text):
+                total += 1
+                yield epic
+
+        if not epics.done:
+            # Cut off at max_tokens or not a JSON array; /generate-epics rejects the same reply
+            raise ValueError(f"Epic stream ended before the JSON array was complete ({total} epics received)")
+
+        print(f"[StoryCrafter] Streamed {total} epics")
+
     async def generate_stories(
         self,
         epic: Dict[str, Any],
-        consensus_messages: List[Dict[str, str]],
-        project_metadata: Dict[str, Any] = None
+        consensus_messages: List[Dict[str, str]] = None,
+        project_metadata: Dict[str, Any] = None,
+        session: BacklogSession = None
     ) -> List[Dict[str, Any]]:
         """
         PUBLIC API: Generate stories for a specific epic
@@ -145,24 +732,72 @@ class VISHKARStoryCrafterService:
             epic: Epic object to generate stories for
             consensus_messages: List of messages from 3-agent discussion
             project_metadata: Optional project metadata
+            session: Context from build_session, instead of consensus_messages/project_metadata
 
         Returns:
             List of story objects for the epic
         """
         print(f"[StoryCrafter] Generating stories for epic: {epic.get('id', 'unknown')}")
 
-        full_context = self._format_full_consensus_for_prompt(consensus_messages, project_metadata)
+        session = self._session_for(consensus_messages, project_metadata, session)
+        full_context, project_metadata = session.full_context, session.project_metadata
         stories = await self._generate_stories_for_epic(epic, full_context, project_metadata)
 
         print(f"[StoryCrafter] Generated {len(stories)} stories for {epic.get('id', 'unknown')}")
         return stories
 
+    async def generate_stories_batch(
+        self,
+        epics: List[Dict[str, Any]],
+        consensus_messages: List[Dict[str, str]] = None,
+        project_metadata: Dict[str, Any] = None,
+        session: BacklogSession = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        PUBLIC API: Generate stories for several epics of the same project in one LLM call
+
+        Args:
+            epics: Epic objects to generate stories for
+            consensus_messages: List of messages from 3-agent discussion
+            project_metadata: Optional project metadata
+            session: Context from build_session, instead of consensus_messages/project_metadata
+
+        Returns:
+            One list of story objects per epic, in the order given
+        """
+        session = self._session_for(consensus_messages, project_metadata, session)
+        if len(epics) == 1:
+            return [await self.generate_stories(epics[0], session=session)]
+
+        print(f"[StoryCrafter] Generating stories for {len(epics)} epics in one batch")
+
+        full_context, project_metadata = session.full_context, session.project_metadata
+        stories_by_position = await self._generate_stories_for_epics_claude(epics, full_context)
+
+        results = [stories_by_position.get(str(position)) for position in range(1, len(epics) + 1)]
+        missed = [index for index, stories in enumerate(results) if not isinstance(stories, list)]
+        if missed:
+            # Epics the model skipped (or all of them, if the reply was unusable)
+            # fall back to single-epic calls, run concurrently
+            print(f"[StoryCrafter] Batch missed {', '.join(epics[i].get('id', 'unknown') for i in missed)}, "
+                  "generating separately")
+            regenerated = await self._gather_bounded(
+                missed,
+                lambda i: self._generate_stories_for_epic(epics[i], full_context, project_metadata)
+            )
+            for index, stories in zip(missed, regenerated):
+                results[index] = stories
+
+        print(f"[StoryCrafter] Generated {sum(len(stories) for stories in results)} stories in batch")
+        return results
+
     async def regenerate_epic(
         self,
         epic: Dict[str, Any],
         user_feedback: str,
-        consensus_messages: List[Dict[str, str]],
-        project_metadata: Dict[str, Any] = None
+        consensus_messages: List[Dict[str, str]] = None,
+        project_metadata: Dict[str, Any] = None,
+        session: BacklogSession = None
     ) -> Dict[str, Any]:
         """
         PUBLIC API: Regenerate a single epic based on user feedback
@@ -172,13 +807,15 @@ class VISHKARStoryCrafterService:
             user_feedback: User's comments on what needs to change
             consensus_messages: List of messages from 3-agent discussion
             project_metadata: Optional project metadata
+            session: Context from build_session, instead of consensus_messages/project_metadata
 
         Returns:
             Regenerated epic object
         """
         print(f"[StoryCrafter] Regenerating epic: {epic.get('id', 'unknown')}")
 
-        full_context = self._format_full_consensus_for_prompt(consensus_messages, project_metadata)
+        session = self._session_for(consensus_messages, project_metadata, session)
+        full_context, project_metadata = session.full_context, session.project_metadata
         regenerated_epic = await self._regenerate_single_epic(epic, user_feedback, full_context, project_metadata)
 
         print(f"[StoryCrafter] Regenerated epic {regenerated_epic.get('id', 'unknown')}")
@@ -189,8 +826,9 @@ class VISHKARStoryCrafterService:
         epic: Dict[str, Any],
         story: Dict[str, Any],
         user_feedback: str,
-        consensus_messages: List[Dict[str, str]],
-        project_metadata: Dict[str, Any] = None
+        consensus_messages: List[Dict[str, str]] = None,
+        project_metadata: Dict[str, Any] = None,
+        session: BacklogSession = None
     ) -> Dict[str, Any]:
         """
         PUBLIC API: Regenerate a single story based on user feedback
@@ -201,18 +839,82 @@ class VISHKARStoryCrafterService:
             user_feedback: User's comments on what needs to change
             consensus_messages: List of messages from 3-agent discussion
             project_metadata: Optional project metadata
+            session: Context from build_session, instead of consensus_messages/project_metadata
 
         Returns:
             Regenerated story object
         """
         print(f"[StoryCrafter] Regenerating story: {story.get('id', 'unknown')}")
 
-        full_context = self._format_full_consensus_for_prompt(consensus_messages, project_metadata)
+        session = self._session_for(consensus_messages, project_metadata, session)
+        full_context, project_metadata = session.full_context, session.project_metadata
         regenerated_story = await self._regenerate_single_story(epic, story, user_feedback, full_context, project_metadata)
 
         print(f"[StoryCrafter] Regenerated story {regenerated_story.get('id', 'unknown')}")
         return regenerated_story
 
+    async def regenerate_stories(
+        self,
+        epic: Dict[str, Any],
+        stories: List[Dict[str, Any]],
+        user_feedback: str,
+        consensus_messages: List[Dict[str, str]] = None,
+        project_metadata: Dict[str, Any] = None,
+        session: BacklogSession = None
+    ) -> List[Dict[str, Any]]:
+        """
+        PUBLIC API: Regenerate several stories of one epic with the same feedback, concurrently
+
+        Args:
+            epic: Parent epic object (for context)
+            stories: Original story objects to regenerate
+            user_feedback: User's comments on what needs to change
+            consensus_messages: List of messages from 3-agent discussion
+            project_metadata: Optional project metadata
+            session: Context from build_session, instead of consensus_messages/project_metadata
+
+        Returns:
+            Regenerated story objects, in the order given
+        """
+        print(f"[StoryCrafter] Regenerating {len(stories)} stories of epic: {epic.get('id', 'unknown')}")
+
+        session = self._session_for(consensus_messages, project_metadata, session)
+        full_context, project_metadata = session.full_context, session.project_metadata
+        regenerated_stories = await self._gather_bounded(
+            stories,
+            lambda story: self._regenerate_single_story(epic, story, user_feedback, full_context, project_metadata)
+        )
+
+        print(f"[StoryCrafter] Regenerated {len(regenerated_stories)} stories")
+        return regenerated_stories
+
+    async def _gather_bounded(
+        self,
+        items: List[Any],
+        operation: Callable[[Any], Awaitable[Any]]
+    ) -> List[Any]:
+        """Run operation over items concurrently, at most max_concurrency at a time"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(item: Any) -> Any:
+            async with semaphore:
+                return await operation(item)
+
+        return await asyncio.gather(*(run(item) for item in items))
+
+    def _session_for(
+        self,
+        consensus_messages: List[Dict[str, str]] = None,
+        project_metadata: Dict[str, Any] = None,
+        session: BacklogSession = None
+    ) -> BacklogSession:
+        """Use the caller's session, or build one from the consensus"""
+        if session is not None:
+            return session
+        if consensus_messages is None:
+            raise ValueError("consensus_messages or session must be provided")
+        return self.build_session(consensus_messages, project_metadata)
+
     # ============================================================
     # STEP 1: EXTRACT REQUIREMENTS
     # ============================================================
@@ -261,20 +963,23 @@ class VISHKARStoryCrafterService:
                 if 'project:' in content.lower():
                     requirements['project_name'] = self._extract_project_name(content)
                     requirements['project_description'] = content
+                continue
+
+            # Lowercase and scan for keywords once per message
+            hits = set(_REQUIREMENT_KEYWORDS_RE.findall(content.lower()))
 
-            elif role == 'alex':  # Product Manager
+            if role == 'alex':  # Product Manager
                 requirements['product_requirements'].append(content)
                 # Extract MVP features
-                if 'mvp' in content.lower() or 'core feature' in content.lower():
+                if 'mvp' in hits or 'core feature' in hits:
                     features = self._extract_features(content)
                     requirements['mvp_features'].extend(features)
 
             elif role == 'blake':  # Technical Architect
                 requirements['technical_requirements'].append(content)
                 # Extract tech stack
-                tech_keywords = ['frontend', 'backend', 'database', 'framework', 'library']
-                for keyword in tech_keywords:
-                    if keyword in content.lower():
+                for keyword in _TECH_KEYWORDS:
+                    if keyword in hits:
                         extracted = self._extract_tech_stack(content, keyword)
                         if extracted:
                             requirements['tech_stack'][keyword] = extracted
@@ -282,22 +987,17 @@ class VISHKARStoryCrafterService:
             elif role == 'casey':  # Project Manager
                 requirements['project_requirements'].append(content)
                 # Extract timeline and team
-                if 'week' in content.lower() or 'month' in content.lower():
+                if 'week' in hits or 'month' in hits:
                     requirements['timeline'] = self._extract_timeline(content)
-                if 'developer' in content.lower() or 'team' in content.lower():
+                if 'developer' in hits or 'team' in hits:
                     requirements['team_size'] = self._extract_team_size(content)
 
         return requirements
 
     def _extract_project_name(self, content: str) -> str:
         """Extract project name from content"""
-        patterns = [
-            r'Project:\s*([^\n]+)',
-            r'Project Name:\s*([^\n]+)',
-            r'Building\s+(?:a|an)\s+([^\n]+)',
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, content, re.IGNORECASE)
+        for pattern in _PROJECT_NAME_PATTERNS:
+            match = pattern.search(content)
             if match:
                 return match.group(1).strip()
         return "Unnamed Project"
@@ -308,8 +1008,8 @@ class VISHKARStoryCrafterService:
         # Look for bullet points or numbered lists
         lines = content.split('\n')
         for line in lines:
-            if line.strip().startswith(('-', '*', '•')) or re.match(r'^\d+\.', line.strip()):
-                feature = re.sub(r'^[-*•\d.]\s*', '', line.strip())
+            if line.strip().startswith(('-', '*', '•')) or _NUMBERED_ITEM_RE.match(line.strip()):
+                feature = _LIST_MARKER_RE.sub('', line.strip())
                 if feature and len(feature) > 10:
                     features.append(feature)
         return features
@@ -317,12 +1017,8 @@ class VISHKARStoryCrafterService:
     def _extract_tech_stack(self, content: str, keyword: str) -> str:
         """Extract technology for specific keyword"""
         # Simple extraction - look for common patterns
-        patterns = [
-            rf'{keyword}:\s*([^\n,]+)',
-            rf'{keyword}\s+(?:using|with)\s+([^\n,]+)',
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, content, re.IGNORECASE)
+        for pattern in _TECH_STACK_PATTERNS[keyword]:
+            match = pattern.search(content)
             if match:
                 return match.group(1).strip()
         return ""
@@ -330,14 +1026,14 @@ class VISHKARStoryCrafterService:
     def _extract_timeline(self, content: str) -> str:
         """Extract timeline information"""
         # Look for patterns like "8 weeks", "3 months", "12-14 weeks"
-        match = re.search(r'(\d+(?:-\d+)?)\s+(week|month)s?', content, re.IGNORECASE)
+        match = _TIMELINE_RE.search(content)
         if match:
             return match.group(0)
         return ""
 
     def _extract_team_size(self, content: str) -> str:
         """Extract team size information"""
-        match = re.search(r'(\d+(?:-\d+)?)\s+(?:developer|dev)s?', content, re.IGNORECASE)
+        match = _TEAM_SIZE_RE.search(content)
         if match:
             return match.group(0)
         return ""
@@ -359,7 +1055,7 @@ class VISHKARStoryCrafterService:
 
         print(f"[StoryCrafter] Calling Claude API (model: {self.claude_model})...")
 
-        message = self.anthropic_client.messages.create(
+        message = await self.anthropic_client.messages.create(
             model=self.claude_model,
             max_tokens=self.claude_max_tokens,
             temperature=self.temperature,
@@ -376,9 +1072,10 @@ class VISHKARStoryCrafterService:
 
         return response_text
 
-    def _build_claude_prompt(self, requirements: Dict[str, Any]) -> str:
+    @staticmethod
+    def _build_claude_prompt(requirements: Dict[str, Any]) -> str:
         """Build optimized prompt for Claude API (legacy mode)"""
-        req_text = self._format_requirements_for_prompt(requirements)
+        req_text = VISHKARStoryCrafterService._format_requirements_for_prompt(requirements)
 
         prompt = f"""You are an expert Agile Product Owner and Technical Architect with 15+ years of experience creating comprehensive project backlogs.
 
@@ -408,7 +1105,8 @@ Generate the backlog now:"""
 
         return prompt
 
-    def _format_requirements_for_prompt(self, req: Dict[str, Any]) -> str:
+    @staticmethod
+    def _format_requirements_for_prompt(req: Dict[str, Any]) -> str:
         """Format requirements dict into readable prompt text"""
         parts = []
 
@@ -445,6 +1143,14 @@ Generate the backlog now:"""
         # Format full context for prompt
         full_context = self._format_full_consensus_for_prompt(consensus_messages, project_metadata)
 
+        # SINGLE SHOT (opt-in): whole backlog in one call when it fits
+        if self.single_shot:
+            print("[StoryCrafter] Trying single-shot backlog generation...")
+            backlog = await self._generate_backlog_single_shot(full_context, project_metadata)
+            if backlog is not None:
+                return backlog
+            print("[StoryCrafter] Single-shot backlog incomplete, falling back to two-phase generation")
+
         # PHASE 1: Generate Epic Structure
         print("[StoryCrafter] Phase 1: Generating epic structure...")
         epics_list = await self._generate_epic_structure(full_context, project_metadata)
@@ -455,46 +1161,120 @@ Generate the backlog now:"""
 
         return expanded_backlog
 
-    def _format_full_consensus_for_prompt(
+    async def _generate_backlog_single_shot(
         self,
-        messages: List[Dict[str, str]],
-        metadata: Dict[str, Any] = None
-    ) -> str:
+        full_context: str,
+        project_metadata: Dict[str, Any] = None
+    ) -> Optional[str]:
         """
-        Format full consensus messages for direct Claude prompt
-        Preserves maximum context from VISHKAR discussion
+        Generate epics and their stories in one tool-use call
+        Returns complete backlog JSON string, or None if the output was truncated or incomplete
         """
-        parts = []
+        prompt = """Generate the complete project backlog for the project described above.
 
-        # Add project metadata if available
-        if metadata:
-            parts.append("### PROJECT OVERVIEW")
-            parts.append(f"**Name**: {metadata.get('project_name', 'N/A')}")
-            parts.append(f"**Description**: {metadata.get('project_description', 'N/A')}")
-            parts.append("")
-
-        # Add full consensus messages
-        parts.append("### 3-AGENT CONSENSUS DISCUSSION")
-        parts.append("")
-
-        for msg in messages:
-            role = msg.get('role', 'unknown').upper()
-            content = msg.get('content', '')
+Cover ALL project areas with 6-8 EPICS (authentication & user management, core features,
+data management, UI/UX, backend infrastructure, testing & QA, deployment & DevOps, additional features).
 
-            parts.append(f"## {role}")
-            parts.append(content)
-            parts.append("")
+Give every epic 3-6 USER STORIES ("As a [persona], I want [goal], so that [benefit]") with ids like
+EPIC-1-1, and at least 4 acceptance criteria each: a GIVEN/WHEN/THEN criterion, specific validation,
+an edge case and a non-functional requirement.
 
-        return '\n'.join(parts)
+Submit the result with the submit_backlog tool."""
 
-    async def _generate_epic_structure(
-        self,
-        full_context: str,
-        project_metadata: Dict[str, Any] = None
-    ) -> List[Dict[str, Any]]:
-        """Phase 1: Generate just the epic structure (6-8 epics)"""
+        message = await self.anthropic_client.messages.create(
+            model=self.claude_model,
+            max_tokens=self.claude_max_tokens,
+            temperature=self.temperature,
+            tools=[_SUBMIT_BACKLOG_TOOL],
+            tool_choice={"type": "tool", "name": "submit_backlog"},
+            messages=[{
+                "role": "user",
+                "content": [_cached_text_block(full_context), {"type": "text", "text": prompt}]
+            }]
+        )
+
+        if message.stop_reason == "max_tokens":
+            return None
+
+        tool_input = next((block.input for block in message.content if block.type == "tool_use"), None)
+        epics = tool_input.get('epics') if isinstance(tool_input, dict) else None
+        if not epics or not all(epic.get('stories') for epic in epics):
+            return None
+
+        print(f"[StoryCrafter] Single-shot generated {len(epics)} epics, "
+              f"{sum(len(epic['stories']) for epic in epics)} stories")
+
+        return orjson.dumps({
+            "project": self._project_summary(project_metadata),
+            "epics": epics
+        }, option=orjson.OPT_INDENT_2).decode()
+
+    def _project_summary(self, project_metadata: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Project block of an assembled backlog"""
+        return {
+            "name": project_metadata.get('project_name', 'Project') if project_metadata else 'Project',
+            "description": project_metadata.get('project_description', '') if project_metadata else '',
+            "target_users": project_metadata.get('target_users', '') if project_metadata else '',
+            "platform": project_metadata.get('platform', '') if project_metadata else ''
+        }
+
+    def _format_full_consensus_for_prompt(
+        self,
+        messages: List[Dict[str, str]],
+        metadata: Dict[str, Any] = None
+    ) -> str:
+        """
+        Format full consensus messages for direct Claude prompt
+        Preserves maximum context from VISHKAR discussion
+        """
+        return self.build_session(messages, metadata).full_context
 
-        prompt = f"""You are an expert Agile Product Owner creating a comprehensive project backlog.
+    def _build_full_consensus_context(
+        self,
+        messages: List[Dict[str, str]],
+        metadata: Dict[str, Any] = None
+    ) -> _ConsensusContext:
+        """Build the full consensus context string (uncached)"""
+        if self.dedup_messages:
+            messages = self._dedupe_messages(messages)
+
+        # Add project metadata if available
+        overview = (
+            "### PROJECT OVERVIEW\n"
+            f"**Name**: {metadata.get('project_name', 'N/A')}\n"
+            f"**Description**: {metadata.get('project_description', 'N/A')}\n\n"
+        ) if metadata else ""
+
+        # Add full consensus messages, one preformatted block per message,
+        # recording where each block starts for _fit_context
+        blocks = [f"## {msg.get('role', 'unknown').upper()}\n{msg.get('content', '')}\n" for msg in messages]
+        message_starts = []
+        position = len(overview) + len(_DISCUSSION_HEADER)
+        for block in blocks:
+            position += 1  # joining newline
+            message_starts.append(position)
+            position += len(block)
+
+        full_context = _ConsensusContext("\n".join(chain((overview + _DISCUSSION_HEADER,), blocks)))
+        full_context.message_starts = tuple(message_starts)
+        return full_context
+
+    def _dedupe_messages(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Replace messages identical to an earlier one with a reference to it"""
+        first_role = {}
+        deduped = []
+        for msg in messages:
+            content = msg.get('content', '')
+            if content and content in first_role:
+                msg = {**msg, 'content': f"(repeat of earlier {first_role[content]} message)"}
+            else:
+                first_role.setdefault(content, msg.get('role', 'unknown').upper())
+            deduped.append(msg)
+        return deduped
+
+    def _build_epic_structure_prompt(self, full_context: str) -> str:
+        """Build the Phase 1 (epic structure) prompt"""
+        return f"""You are an expert Agile Product Owner creating a comprehensive project backlog.
 
 Your task: Generate a complete EPIC STRUCTURE for the project described below.
 
@@ -530,25 +1310,55 @@ Return JSON array of epics ONLY. No stories yet.
 
 Generate 6-8 epics covering all areas. JSON only, no markdown:"""
 
-        message = self.anthropic_client.messages.create(
+    async def _stream_text(self, **request) -> AsyncIterator[str]:
+        """Stream the text of a Claude response as it is generated"""
+        async with self.anthropic_client.messages.stream(**request) as stream:
+            async for text in stream.text_stream:
+                yield text
+
+    async def _complete_text(self, **request) -> str:
+        """
+        Text of a Claude response, streamed so a long generation isn't one
+        idle read; falls back to a plain request if the stream breaks before
+        any text arrives
+        """
+        chunks = []
+        try:
+            async for text in self._stream_text(**request):
+                chunks.append(text)
+        except anthropic.APIStatusError:
+            raise  # The API rejected the request; a plain request would fail the same way
+        except Exception as e:
+            if chunks:
+                raise
+            print(f"[StoryCrafter] Streaming failed ({e}), retrying without streaming")
+            message = await self.anthropic_client.messages.create(**request)
+            return message.content[0].text
+        return "".join(chunks)
+
+    async def _generate_epic_structure(
+        self,
+        full_context: str,
+        project_metadata: Dict[str, Any] = None
+    ) -> List[Dict[str, Any]]:
+        """Phase 1: Generate just the epic structure (6-8 epics)"""
+
+        prompt = self._build_epic_structure_prompt(full_context)
+
+        # The whole prompt only varies with the consensus, so repeat calls for
+        # the same discussion can be served from the prompt cache
+        message = await self.anthropic_client.messages.create(
             model=self.claude_model,
             max_tokens=4096,
             temperature=self.temperature,
-            messages=[{"role": "user", "content": prompt}]
+            messages=[{"role": "user", "content": [_cached_text_block(prompt)]}]
         )
 
         response_text = message.content[0].text
         print(f"[StoryCrafter] Phase 1 complete: {len(response_text)} chars")
 
         # Parse JSON
-        response_text = response_text.strip()
-        if response_text.startswith('```'):
-            response_text = response_text.split('```')[1]
-            if response_text.startswith('json'):
-                response_text = response_text[4:]
-        response_text = response_text.strip()
-
-        epics = json.loads(response_text)
+        epics = orjson.loads(_strip_code_fence(response_text))
         print(f"[StoryCrafter] Generated {len(epics)} epics")
         return epics
 
@@ -563,24 +1373,35 @@ Generate 6-8 epics covering all areas. JSON only, no markdown:"""
         Returns complete backlog JSON string
         """
 
-        all_stories_by_epic = {}
-
-        for i, epic in enumerate(epics_list, 1):
-            print(f"[StoryCrafter]   Expanding {epic['id']}: {epic['title']}...")
+        # Expand all epics concurrently, bounded to respect provider rate limits
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        generate_stories = self._generate_stories_for_epic
 
-            stories = await self._generate_stories_for_epic(epic, full_context, project_metadata)
-            all_stories_by_epic[epic['id']] = stories
+        async def expand(epic: Dict[str, Any]) -> List[Dict[str, Any]]:
+            async def attempt() -> List[Dict[str, Any]]:
+                async with semaphore:
+                    print(f"[StoryCrafter]   Expanding {epic['id']}: {epic['title']}...")
+                    return await generate_stories(epic, full_context, project_metadata)
 
+            # Only this epic is retried on a transient error, and the backoff
+            # wait doesn't hold a concurrency slot
+            stories = await _retry_transient(attempt, f"Expanding {epic['id']}")
             print(f"[StoryCrafter]   Generated {len(stories)} stories for {epic['id']}")
+            return stories
+
+        results = await asyncio.gather(*(expand(epic) for epic in epics_list), return_exceptions=True)
+
+        # One failed epic shouldn't discard the stories of all the others
+        all_stories_by_epic = {}
+        for epic, result in zip(epics_list, results):
+            if isinstance(result, BaseException):
+                print(f"[StoryCrafter]   Story generation failed for {epic['id']}: {result}")
+                result = []
+            all_stories_by_epic[epic['id']] = result
 
         # Assemble final backlog
         final_backlog = {
-            "project": {
-                "name": project_metadata.get('project_name', 'Project') if project_metadata else 'Project',
-                "description": project_metadata.get('project_description', '') if project_metadata else '',
-                "target_users": project_metadata.get('target_users', '') if project_metadata else '',
-                "platform": project_metadata.get('platform', '') if project_metadata else ''
-            },
+            "project": self._project_summary(project_metadata),
             "epics": []
         }
 
@@ -591,7 +1412,7 @@ Generate 6-8 epics covering all areas. JSON only, no markdown:"""
             epic_with_stories.pop('story_count_target', None)
             final_backlog['epics'].append(epic_with_stories)
 
-        return json.dumps(final_backlog, indent=2)
+        return orjson.dumps(final_backlog, option=orjson.OPT_INDENT_2).decode()
 
     async def _generate_stories_for_epic(
         self,
@@ -601,146 +1422,101 @@ Generate 6-8 epics covering all areas. JSON only, no markdown:"""
     ) -> List[Dict[str, Any]]:
         """
         Generate 3-6 detailed stories for a single epic
-        Uses Claude (Anthropic) as primary, falls back to GPT-5 if needed
+        Uses Claude (Anthropic)
         """
         # Use Claude as primary for story generation
         return await self._generate_stories_for_epic_claude(epic, full_context, project_metadata)
 
-    async def _generate_stories_for_epic_gpt5(
+    async def _generate_stories_for_epic_claude(
         self,
         epic: Dict[str, Any],
         full_context: str,
         project_metadata: Dict[str, Any] = None
     ) -> List[Dict[str, Any]]:
-        """
-        DEPRECATED: Generate 3-6 detailed stories for a single epic using GPT-5
-        Now using Claude as primary method
-        """
-
+        """Generate stories for a single epic using Claude"""
         target_count = epic.get('story_count_target', 4)
 
-        system_prompt = """You are an expert Agile Product Owner and Technical Architect with 15+ years of experience.
-You create comprehensive, production-ready user stories with detailed acceptance criteria and technical implementation tasks."""
-
-        user_prompt = f"""Generate {target_count} DETAILED USER STORIES for this epic:
-
-## EPIC DETAILS
-**ID**: {epic['id']}
-**Title**: {epic['title']}
-**Description**: {epic['description']}
-
-## FULL PROJECT CONTEXT
-{full_context}
-
-## OUTPUT FORMAT
-
-Return a JSON array of stories. CRITICAL: Output ONLY valid JSON, no markdown:
+        # Context first: it is identical for every epic of the backlog, so it
+        # forms a cacheable prefix ahead of the epic-specific instruction
+        context_block = f"Context: {_fit_context(full_context, self.story_context_tokens)}"
+        prompt = f"""Generate {target_count} user stories for epic: {epic['title']}
 
-[
-  {{
-    "id": "{epic['id']}-1",
-    "title": "Concise Story Title",
-    "description": "As a [persona], I want [goal], so that [benefit]",
-    "acceptance_criteria": [
-      "GIVEN [precondition] WHEN [action] THEN [expected result]",
-      "System validates [specific condition] and displays [specific feedback]",
-      "User can successfully [specific action] within [time/performance constraint]",
-      "[Edge case]: System handles [error scenario] by [expected behavior]",
-      "[Non-functional]: [Performance/security/usability requirement met]"
-    ],
-    "technical_tasks": ["Task 1", "Task 2", "Task 3", "Task 4", "Task 5"],
-    "priority": "P0",
-    "story_points": 5,
-    "estimated_hours": 10,
-    "dependencies": [],
-    "tags": ["mvp", "backend", "frontend"],
-    "layer": "fullstack"
-  }}
-]
+Return JSON array only."""
 
-Generate exactly {target_count} stories. Output JSON only:"""
+        # Deterministic generations are reused for an identical prompt
+        cache_key = _content_key(self.claude_model, context_block, prompt) if self.temperature == 0 else None
+        cached_text = self._story_cache.get(cache_key) if cache_key else None
+        if cached_text is not None:
+            return _parse_json_array(cached_text)
 
-        # Use GPT-5 with massive context window
-        response = self.openai_client.chat.completions.create(
-            model=self.gpt_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_completion_tokens=self.gpt_max_tokens,
-            response_format={"type": "json_object"}
+        message = await self.anthropic_client.messages.create(
+            model=self.claude_model,
+            max_tokens=4096,
+            temperature=self.temperature,
+            messages=[{
+                "role": "user",
+                "content": [_cached_text_block(context_block), {"type": "text", "text": prompt}]
+            }]
         )
 
-        response_text = response.choices[0].message.content.strip()
-
-        # Parse JSON
-        try:
-            data = json.loads(response_text)
-
-            # Handle if GPT wraps stories in an object
-            if isinstance(data, dict) and 'stories' in data:
-                stories = data['stories']
-            elif isinstance(data, list):
-                stories = data
-            else:
-                # Fallback: look for array in response
-                if '[' in response_text:
-                    start = response_text.find('[')
-                    end = response_text.rfind(']')
-                    array_text = response_text[start:end+1]
-                    stories = json.loads(array_text)
-                else:
-                    raise ValueError("Could not find story array in GPT-5 response")
-
-        except json.JSONDecodeError as e:
-            print(f"[StoryCrafter] ❌ Failed to parse GPT-5 response as JSON: {e}")
-            # This method is deprecated - should not be called anymore
-            raise ValueError(f"GPT-5 story generation failed: {e}")
+        response_text = _strip_code_fence(message.content[0].text)
 
+        stories = _parse_json_array(response_text)
+        if cache_key:
+            self._story_cache.put(cache_key, response_text)
         return stories
 
-    async def _generate_stories_for_epic_claude(
+    async def _generate_stories_for_epics_claude(
         self,
-        epic: Dict[str, Any],
-        full_context: str,
-        project_metadata: Dict[str, Any] = None
-    ) -> List[Dict[str, Any]]:
-        """Fallback method: Generate stories using Claude if GPT-5 fails"""
-        target_count = epic.get('story_count_target', 4)
+        epics: List[Dict[str, Any]],
+        full_context: str
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Generate stories for several epics in one Claude call, keyed by epic position ("1", "2", ...).
+        A truncated or unparseable reply yields no positions, so every epic is generated separately.
+        """
+        epic_lines = "\n".join(
+            f"{position}. {epic['title']} ({epic.get('story_count_target', 4)} stories)"
+            for position, epic in enumerate(epics, 1)
+        )
 
-        prompt = f"""Generate {target_count} user stories for epic: {epic['title']}
+        context_block = f"Context: {_fit_context(full_context, self.story_context_tokens)}"
+        prompt = f"""Generate user stories for each of these epics:
 
-Context: {full_context[:2000]}
+{epic_lines}
 
-Return JSON array only."""
+Return a JSON object mapping each epic number to its JSON array of stories, e.g. {{"1": [...], "2": [...]}}. JSON only."""
 
-        message = self.anthropic_client.messages.create(
+        message = await self.anthropic_client.messages.create(
             model=self.claude_model,
-            max_tokens=4096,
+            max_tokens=min(4096 * len(epics), self.claude_max_tokens),
             temperature=self.temperature,
-            messages=[{"role": "user", "content": prompt}]
+            messages=[{
+                "role": "user",
+                "content": [_cached_text_block(context_block), {"type": "text", "text": prompt}]
+            }]
         )
 
-        response_text = message.content[0].text.strip()
-
-        # Clean JSON
-        if response_text.startswith('```'):
-            response_text = response_text.split('```')[1]
-            if response_text.startswith('json'):
-                response_text = response_text[4:]
-        response_text = response_text.strip()
+        if message.stop_reason == "max_tokens":
+            print("[StoryCrafter] Batched stories cut off at max_tokens, generating per epic")
+            return {}
 
-        stories = json.loads(response_text)
-        return stories
+        try:
+            stories_by_position = orjson.loads(_strip_code_fence(message.content[0].text))
+        except orjson.JSONDecodeError as e:
+            print(f"[StoryCrafter] Failed to parse batched stories ({e}), generating per epic")
+            return {}
+        return stories_by_position if isinstance(stories_by_position, dict) else {}
 
     # ============================================================
     # ACCEPTANCE CRITERIA VALIDATION
     # ============================================================
 
+    @staticmethod
     def _validate_acceptance_criteria(
-        self,
         acceptance_criteria: List[str],
-        story_id: str = "unknown"
+        story_id: str = "unknown",
+        verbose: bool = False
     ) -> Dict[str, Any]:
         """
         Validate acceptance criteria for quality and completeness
@@ -748,50 +1524,35 @@ Return JSON array only."""
         Args:
             acceptance_criteria: List of acceptance criteria strings
             story_id: Story identifier for logging
+            verbose: Also format a human-readable message per warning code
 
         Returns:
-            Dictionary with validation results
+            Dictionary with validation results; warning_codes holds WARN_* codes,
+            warnings their messages (only when verbose)
         """
+        count = len(acceptance_criteria)
         validation = {
             "is_valid": True,
+            "warning_codes": [],
             "warnings": [],
             "quality_score": 0,
-            "total_criteria": len(acceptance_criteria)
+            "total_criteria": count
         }
+        codes = validation["warning_codes"]
 
-        if not acceptance_criteria or len(acceptance_criteria) < 4:
+        if count < 4:
             validation["is_valid"] = False
-            validation["warnings"].append(f"Story {story_id}: Less than 4 acceptance criteria (found {len(acceptance_criteria)})")
-
-        if len(acceptance_criteria) > 10:
-            validation["warnings"].append(f"Story {story_id}: More than 10 criteria may be too granular (found {len(acceptance_criteria)})")
-
-        # Check for quality indicators
-        quality_indicators = {
-            "has_given_when_then": False,
-            "has_edge_cases": False,
-            "has_non_functional": False,
-            "has_specific_validation": False
-        }
-
-        for criterion in acceptance_criteria:
-            criterion_lower = criterion.lower()
+            codes.append(WARN_TOO_FEW)
 
-            # Check for Given-When-Then format
-            if "given" in criterion_lower and "when" in criterion_lower and "then" in criterion_lower:
-                quality_indicators["has_given_when_then"] = True
+        if count > 10:
+            codes.append(WARN_TOO_MANY)
 
-            # Check for edge cases
-            if "edge case" in criterion_lower or "error" in criterion_lower or "failure" in criterion_lower:
-                quality_indicators["has_edge_cases"] = True
+        # Check for quality indicators (Given-When-Then format, edge cases,
+        # non-functional requirements, specific validation). Unchanged criteria
+        # (e.g. re-validating a backlog after one story was regenerated) hit the cache.
+        found = _ac_quality_found(tuple(acceptance_criteria))
 
-            # Check for non-functional requirements
-            if any(term in criterion_lower for term in ["performance", "security", "usability", "accessibility", "non-functional"]):
-                quality_indicators["has_non_functional"] = True
-
-            # Check for specific validation
-            if "validate" in criterion_lower or "verify" in criterion_lower:
-                quality_indicators["has_specific_validation"] = True
+        quality_indicators = {name: name in found for name in _AC_QUALITY_RE.groupindex}
 
         # Calculate quality score
         validation["quality_score"] = sum(quality_indicators.values())
@@ -799,14 +1560,18 @@ Return JSON array only."""
 
         # Add recommendation if quality is low
         if validation["quality_score"] < 2:
-            validation["warnings"].append(
-                f"Story {story_id}: Low quality score ({validation['quality_score']}/4). "
-                "Consider adding Given-When-Then format, edge cases, or non-functional requirements."
-            )
+            codes.append(WARN_LOW_QUALITY)
+
+        if verbose:
+            validation["warnings"] = [
+                _WARNING_MESSAGES[code].format(story_id=story_id, count=count, score=validation["quality_score"])
+                for code in codes
+            ]
 
         return validation
 
-    def _validate_backlog_acceptance_criteria(self, backlog: Dict[str, Any]) -> None:
+    @staticmethod
+    def _validate_backlog_acceptance_criteria(backlog: Dict[str, Any]) -> None:
         """
         Validate acceptance criteria for all stories in backlog
 
@@ -819,27 +1584,33 @@ Return JSON array only."""
 
         total_stories = 0
         stories_with_warnings = 0
-        all_warnings = []
-
-        for epic in backlog.get('epics', []):
-            for story in epic.get('stories', []):
-                total_stories += 1
-                story_id = story.get('id', 'unknown')
-                acceptance_criteria = story.get('acceptance_criteria', [])
-
-                validation = self._validate_acceptance_criteria(acceptance_criteria, story_id)
-
-                if validation['warnings']:
-                    stories_with_warnings += 1
-                    all_warnings.extend(validation['warnings'])
+        warning_count = 0
+        shown_warnings = []  # Only the first 5 warnings are logged
+        codes_by_criteria = {}  # Templated stories often share criteria; validate each list once
+        validate = VISHKARStoryCrafterService._validate_acceptance_criteria
+
+        for story in chain.from_iterable(epic.get('stories') or () for epic in backlog.get('epics') or ()):
+            total_stories += 1
+            acceptance_criteria = tuple(story.get('acceptance_criteria') or ())
+            codes = codes_by_criteria.get(acceptance_criteria)
+            if codes is None:
+                codes = codes_by_criteria[acceptance_criteria] = validate(acceptance_criteria)['warning_codes']
+
+            if codes:
+                stories_with_warnings += 1
+                warning_count += len(codes)
+                if len(shown_warnings) < 5:
+                    # Messages are only formatted for the warnings that get logged
+                    warnings = validate(acceptance_criteria, story.get('id', 'unknown'), verbose=True)['warnings']
+                    shown_warnings.extend(warnings[:5 - len(shown_warnings)])
 
         # Log summary
-        if all_warnings:
+        if warning_count:
             print(f"[StoryCrafter] ⚠️  Acceptance Criteria Validation: {stories_with_warnings}/{total_stories} stories have quality warnings")
-            for warning in all_warnings[:5]:  # Show first 5 warnings
+            for warning in shown_warnings:
                 print(f"[StoryCrafter]   - {warning}")
-            if len(all_warnings) > 5:
-                print(f"[StoryCrafter]   ... and {len(all_warnings) - 5} more warnings")
+            if warning_count > 5:
+                print(f"[StoryCrafter]   ... and {warning_count - 5} more warnings")
         else:
             print(f"[StoryCrafter] ✅ All {total_stories} stories have quality acceptance criteria")
 
@@ -847,20 +1618,16 @@ Return JSON array only."""
     # STEP 3: PARSE AND VALIDATE
     # ============================================================
 
-    def _parse_and_validate(self, raw_json_str: str) -> Dict[str, Any]:
+    @staticmethod
+    def _parse_and_validate(raw_json_str: str) -> Dict[str, Any]:
         """Parse and validate JSON backlog"""
         # Clean up markdown code blocks if present
-        cleaned = raw_json_str.strip()
-        if cleaned.startswith('```'):
-            cleaned = cleaned.split('```')[1]
-            if cleaned.startswith('json'):
-                cleaned = cleaned[4:]
-        cleaned = cleaned.strip()
+        cleaned = _strip_code_fence(raw_json_str)
 
         # Parse JSON
         try:
-            backlog = json.loads(cleaned)
-        except json.JSONDecodeError as e:
+            backlog = orjson.loads(cleaned)
+        except orjson.JSONDecodeError as e:
             print(f"[StoryCrafter] ❌ JSON parse error: {e}")
             raise ValueError(f"Failed to parse backlog JSON: {e}")
 
@@ -882,26 +1649,31 @@ Return JSON array only."""
     def _transform_to_vishkar_format(
         self,
         parsed_backlog: Dict[str, Any],
-        requirements: Dict[str, Any]
+        requirements: Dict[str, Any] = None
     ) -> Dict[str, Any]:
         """Transform parsed backlog to VISHKAR frontend format"""
 
-        total_stories = sum(len(epic.get('stories', [])) for epic in parsed_backlog.get('epics', []))
-        total_hours = sum(
-            sum(story.get('estimated_hours', 0) for story in epic.get('stories', []))
-            for epic in parsed_backlog.get('epics', [])
-        )
+        epics = parsed_backlog.get('epics', [])
+
+        # Story and hour totals in one pass over the backlog
+        total_stories = 0
+        total_hours = 0
+        for epic in epics:
+            stories = epic.get('stories') or ()
+            total_stories += len(stories)
+            for story in stories:
+                total_hours += story.get('estimated_hours', 0)
 
         vishkar_format = {
             "project": parsed_backlog.get('project', {}),
             "metadata": {
-                "total_epics": len(parsed_backlog.get('epics', [])),
+                "total_epics": len(epics),
                 "total_stories": total_stories,
                 "total_estimated_hours": total_hours,
-                "generated_at": datetime.utcnow().isoformat() + "Z",
+                "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
                 "generator": "StoryCrafter v2.0 (Anthropic + OpenAI)"
             },
-            "epics": parsed_backlog.get('epics', [])
+            "epics": epics
         }
 
         return vishkar_format
@@ -930,70 +1702,33 @@ Return JSON array only."""
             Regenerated epic object
         """
 
-        prompt = f"""You are an expert Agile Product Owner creating project epics.
-
-## ORIGINAL EPIC
-
-**ID**: {epic['id']}
-**Title**: {epic['title']}
-**Description**: {epic['description']}
-**Priority**: {epic.get('priority', 'Medium')}
-**Category**: {epic.get('category', 'MVP')}
-
-## USER FEEDBACK
-
-The user has provided the following feedback on this epic:
-
-{user_feedback}
-
-## PROJECT CONTEXT
-
-{full_context}
-
-## TASK
-
-Based on the user feedback, generate an IMPROVED VERSION of this epic.
-
-The regenerated epic should:
-1. Address all points raised in the user feedback
-2. Maintain the same ID: {epic['id']}
-3. Keep the same general scope unless feedback suggests otherwise
-4. Have an improved title and description
-5. Maintain consistency with the project context
-
-## OUTPUT FORMAT
-
-Return a JSON object for the regenerated epic:
-
-{{
-  "id": "{epic['id']}",
-  "title": "Improved Epic Title",
-  "description": "Enhanced epic description (2-3 sentences)",
-  "priority": "High|Medium|Low",
-  "category": "MVP|Post-MVP|Technical",
-  "story_count_target": 4,
-  "regeneration_notes": "Brief note on what was changed based on feedback"
-}}
-
-Generate JSON only, no markdown:"""
-
-        message = self.anthropic_client.messages.create(
+        prompt = "".join((
+            "## ORIGINAL EPIC\n\n",
+            f"**ID**: {epic['id']}\n"
+            f"**Title**: {epic['title']}\n"
+            f"**Description**: {epic['description']}\n"
+            f"**Priority**: {epic.get('priority', 'Medium')}\n"
+            f"**Category**: {epic.get('category', 'MVP')}\n\n",
+            "## USER FEEDBACK\n\nThe user has provided the following feedback on this epic:\n\n",
+            user_feedback,
+            _EPIC_REGEN_TAIL.substitute(id=epic['id'])
+        ))
+
+        response_text = _strip_code_fence(await self._complete_text(
             model=self.claude_model,
             max_tokens=2048,
             temperature=self.temperature,
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        response_text = message.content[0].text.strip()
-
-        # Clean JSON
-        if response_text.startswith('```'):
-            response_text = response_text.split('```')[1]
-            if response_text.startswith('json'):
-                response_text = response_text[4:]
-        response_text = response_text.strip()
+            system=_EPIC_REGEN_SYSTEM,
+            messages=[{
+                "role": "user",
+                "content": [
+                    _cached_text_block(f"## PROJECT CONTEXT\n\n{full_context}"),
+                    {"type": "text", "text": prompt}
+                ]
+            }]
+        ))
 
-        regenerated_epic = json.loads(response_text)
+        regenerated_epic = orjson.loads(response_text)
         print(f"[StoryCrafter] Regenerated epic {epic['id']}")
 
         return regenerated_epic
@@ -1046,115 +1781,47 @@ Generate JSON only, no markdown:"""
             Regenerated story object with improved acceptance criteria and tasks
         """
 
-        system_prompt = """You are an expert Agile Product Owner and Technical Architect with 15+ years of experience.
-You create comprehensive, production-ready user stories with detailed acceptance criteria and technical implementation tasks.
-Your stories are clear, actionable, and follow industry best practices."""
-
-        user_prompt = f"""Regenerate a USER STORY based on user feedback.
-
-## PARENT EPIC
-
-**ID**: {epic['id']}
-**Title**: {epic['title']}
-**Description**: {epic['description']}
-
-## ORIGINAL STORY
-
-**ID**: {story['id']}
-**Title**: {story['title']}
-**Description**: {story.get('description', '')}
-**Priority**: {story.get('priority', 'P1')}
-**Story Points**: {story.get('story_points', 0)}
-**Estimated Hours**: {story.get('estimated_hours', 0)}
-
-**Current Acceptance Criteria**:
-{json.dumps(story.get('acceptance_criteria', []), indent=2)}
-
-**Current Technical Tasks**:
-{json.dumps(story.get('technical_tasks', []), indent=2)}
-
-## USER FEEDBACK
-
-The user has provided the following feedback on this story:
-
-{user_feedback}
-
-## PROJECT CONTEXT
-
-{full_context[:2000]}
-
-## TASK
-
-Generate an IMPROVED VERSION of this story that addresses the user feedback.
-
-The regenerated story should:
-1. Address all points raised in the user feedback
-2. Maintain the same ID: {story['id']}
-3. Follow proper format: "As a [persona], I want [goal], so that [benefit]"
-4. Include 5-7 DETAILED acceptance criteria using:
-   - Given-When-Then format where applicable
-   - Specific, testable, and measurable conditions
-   - Edge cases and error scenarios
-   - Non-functional requirements (performance, security, usability)
-5. List 4-7 detailed technical implementation tasks
-6. Assign realistic story points (2, 3, 5, or 8)
-7. Estimate hours appropriately
-8. Identify dependencies if applicable
-9. Add relevant tags (mvp, backend, frontend, etc.)
-10. Specify layer (fullstack, backend, frontend, database, or infrastructure)
-
-## OUTPUT FORMAT
-
-Return a JSON object for the regenerated story. CRITICAL: Output ONLY valid JSON, no markdown:
-
-{{
-  "id": "{story['id']}",
-  "title": "Improved Story Title",
-  "description": "As a [persona], I want [goal], so that [benefit]",
-  "acceptance_criteria": [
-    "GIVEN [precondition] WHEN [action] THEN [expected result]",
-    "System validates [specific condition] and provides [specific feedback]",
-    "User can successfully [specific action] within [performance constraint]",
-    "[Edge case]: System handles [error scenario] by [expected behavior]",
-    "[Non-functional]: [Performance/security/usability requirement met]",
-    "Additional detailed testable criterion 6"
-  ],
-  "technical_tasks": [
-    "Improved implementation task 1",
-    "Improved implementation task 2",
-    "Improved implementation task 3",
-    "Improved implementation task 4",
-    "Improved implementation task 5",
-    "Testing task 6"
-  ],
-  "priority": "P0",
-  "story_points": 5,
-  "estimated_hours": 10,
-  "dependencies": [],
-  "tags": ["mvp", "backend", "frontend"],
-  "layer": "fullstack",
-  "regeneration_notes": "Brief note on what was changed based on feedback"
-}}
-
-Generate JSON only, no markdown code blocks:"""
+        user_prompt = "".join((
+            "Regenerate a USER STORY based on user feedback.\n\n## PARENT EPIC\n\n",
+            f"**ID**: {epic['id']}\n"
+            f"**Title**: {epic['title']}\n"
+            f"**Description**: {epic['description']}\n\n",
+            "## ORIGINAL STORY\n\n",
+            f"**ID**: {story['id']}\n"
+            f"**Title**: {story['title']}\n"
+            f"**Description**: {story.get('description', '')}\n"
+            f"**Priority**: {story.get('priority', 'P1')}\n"
+            f"**Story Points**: {story.get('story_points', 0)}\n"
+            f"**Estimated Hours**: {story.get('estimated_hours', 0)}\n\n",
+            "**Current Acceptance Criteria**:\n",
+            orjson.dumps(story.get('acceptance_criteria', []), option=orjson.OPT_INDENT_2).decode(),
+            "\n\n**Current Technical Tasks**:\n",
+            orjson.dumps(story.get('technical_tasks', []), option=orjson.OPT_INDENT_2).decode(),
+            "\n\n## USER FEEDBACK\n\nThe user has provided the following feedback on this story:\n\n",
+            user_feedback,
+            "\n\n## PROJECT CONTEXT\n\n",
+            _fit_context(full_context, self.story_context_tokens),
+            _GPT5_STORY_REGEN_TAIL.substitute(id=story['id'])
+        ))
 
         # Use GPT-5 for detailed story regeneration
-        response = self.openai_client.chat.completions.create(
+        response = await self.openai_client.chat.completions.create(
             model=self.gpt_model,
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": _GPT5_STORY_REGEN_SYSTEM},
                 {"role": "user", "content": user_prompt}
             ],
             max_completion_tokens=8192,  # More tokens for detailed story
             response_format={"type": "json_object"}  # Force JSON response
         )
 
-        response_text = response.choices[0].message.content.strip()
+        # orjson skips surrounding whitespace itself; content is None on a refusal
+        response_text = response.choices[0].message.content or ""
 
         # Parse JSON
         try:
-            regenerated_story = json.loads(response_text)
-        except json.JSONDecodeError as e:
+            regenerated_story = orjson.loads(response_text)
+        except orjson.JSONDecodeError as e:
             print(f"[StoryCrafter] ❌ Failed to parse GPT-5 response: {e}")
             # Fallback to Claude if GPT-5 fails
             print(f"[StoryCrafter] Falling back to Claude for story {story['id']}")
@@ -1176,80 +1843,28 @@ Generate JSON only, no markdown code blocks:"""
         Fallback: Regenerate story using Claude if GPT-5 fails
         """
 
-        prompt = f"""You are an expert Agile Product Owner creating user stories.
-
-## PARENT EPIC: {epic['title']}
-{epic['description']}
-
-## ORIGINAL STORY
-
-ID: {story['id']}
-Title: {story['title']}
-Description: {story.get('description', '')}
-
-## USER FEEDBACK
-
-{user_feedback}
-
-## PROJECT CONTEXT
-
-{full_context[:1500]}
-
-## TASK
-
-Generate an IMPROVED VERSION addressing the feedback.
-
-Include:
-- "As a [persona], I want [goal], so that [benefit]" format
-- 5-7 DETAILED acceptance criteria (use Given-When-Then format, include edge cases, non-functional requirements)
-- 4-7 detailed technical tasks
-- Realistic story points and hours
-
-## OUTPUT FORMAT
-
-JSON object:
-
-{{
-  "id": "{story['id']}",
-  "title": "Improved Title",
-  "description": "As a [persona], I want [goal], so that [benefit]",
-  "acceptance_criteria": [
-    "GIVEN [precondition] WHEN [action] THEN [expected result]",
-    "System validates [specific condition] and provides [specific feedback]",
-    "User can [specific action] within [performance constraint]",
-    "[Edge case]: System handles [error scenario] by [expected behavior]",
-    "[Non-functional]: [Performance/security/usability requirement]",
-    "Additional detailed testable criterion"
-  ],
-  "technical_tasks": ["Task 1", "Task 2", "Task 3", "Task 4", "Task 5"],
-  "priority": "P0",
-  "story_points": 5,
-  "estimated_hours": 10,
-  "dependencies": [],
-  "tags": ["mvp", "backend"],
-  "layer": "fullstack",
-  "regeneration_notes": "Changes made based on feedback"
-}}
-
-JSON only:"""
-
-        message = self.anthropic_client.messages.create(
+        prompt = "".join((
+            f"## PARENT EPIC: {epic['title']}\n{epic['description']}\n\n",
+            f"## ORIGINAL STORY\n\nID: {story['id']}\nTitle: {story['title']}\n"
+            f"Description: {story.get('description', '')}\n\n",
+            "## USER FEEDBACK\n\n",
+            user_feedback,
+            _STORY_REGEN_TAIL.substitute(id=story['id'])
+        ))
+        context_block = f"## PROJECT CONTEXT\n\n{_fit_context(full_context, self.story_context_tokens)}"
+
+        response_text = _strip_code_fence(await self._complete_text(
             model=self.claude_model,
             max_tokens=4096,
             temperature=self.temperature,
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        response_text = message.content[0].text.strip()
-
-        # Clean JSON
-        if response_text.startswith('```'):
-            response_text = response_text.split('```')[1]
-            if response_text.startswith('json'):
-                response_text = response_text[4:]
-        response_text = response_text.strip()
+            system=_STORY_REGEN_SYSTEM,
+            messages=[{
+                "role": "user",
+                "content": [_cached_text_block(context_block), {"type": "text", "text": prompt}]
+            }]
+        ))
 
-        regenerated_story = json.loads(response_text)
+        regenerated_story = orjson.loads(response_text)
         return regenerated_story
 
 
@@ -1257,13 +1872,7 @@ JSON only:"""
 # SINGLETON INSTANCE
 # ============================================================
 
-_story_crafter_instance = None
-
+@lru_cache(maxsize=8)
 def get_storycrafter_service(anthropic_api_key: str = None, openai_api_key: str = None):
-    """Get singleton instance of StoryCrafter service"""
-    global _story_crafter_instance
-
-    if _story_crafter_instance is None:
-        _story_crafter_instance = VISHKARStoryCrafterService(anthropic_api_key, openai_api_key)
-
-    return _story_crafter_instance
+    """Get the shared StoryCrafter service instance for a set of credentials"""
+    return VISHKARStoryCrafterService(anthropic_api_key, openai_api_key)
@@ -1,22 +1,91 @@
 """
 Pytest configuration and fixtures for StoryCrafter tests
 """
+import anthropic
+import httpx
+import json
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import Mock, AsyncMock
-import sys
-import os
-
-# Add parent directory to path for imports
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from index import app
+from storycrafter_service import VISHKARStoryCrafterService
+
+
+class ClaudeAPI:
+    """
+    Canned Anthropic Messages API behind a mock HTTP transport, so the SDK
+    builds and parses real requests and responses. Queued replies are served
+    in order and every request body is recorded.
+    """
+
+    def __init__(self):
+        self.replies = []
+        self.requests = []
+        self.client = anthropic.AsyncAnthropic(
+            api_key="test-key",
+            max_retries=0,
+            http_client=anthropic.DefaultAsyncHttpxClient(transport=httpx.MockTransport(self._handle))
+        )
+
+    def reply(self, *content, stop_reason="end_turn"):
+        """Queue a reply; str content becomes a text block, dicts are sent as-is"""
+        self.replies.append({
+            "id": "msg_test",
+            "type": "message",
+            "role": "assistant",
+            "model": "claude-test",
+            "content": [{"type": "text", "text": block} if isinstance(block, str) else block for block in content],
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": {"input_tokens": 1, "output_tokens": 1}
+        })
+
+    def _handle(self, request):
+        self.requests.append(json.loads(request.content))
+        return httpx.Response(200, json=self.replies.pop(0))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def api_keys():
+    """Mock API keys in the environment for the whole test session"""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('ANTHROPIC_API_KEY', 'test-key')
+        mp.setenv('OPENAI_API_KEY', 'test-key')
+        yield
+
+
+@pytest.fixture(scope="session")
+def client(api_keys):
+    """FastAPI test client shared by the whole session; runs the app lifespan once"""
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="module")
+def _claude_api_transport():
+    """One canned Claude API per module, wired into the module's service"""
+    return ClaudeAPI()
+
+
+@pytest.fixture(scope="module")
+def service(api_keys, _claude_api_transport):
+    """
+    Service instance with mock API keys, shared by the tests of a module.
+    Its Claude calls go to the canned API (see the claude_api fixture).
+    Tests that change a setting on it use monkeypatch.setattr so it is restored.
+    """
+    service = VISHKARStoryCrafterService()
+    service.anthropic_client = _claude_api_transport.client
+    return service
 
 
 @pytest.fixture
-def client():
-    """FastAPI test client"""
-    return TestClient(app)
+def claude_api(_claude_api_transport):
+    """The service's canned Claude API, emptied for the test"""
+    _claude_api_transport.replies.clear()
+    _claude_api_transport.requests.clear()
+    return _claude_api_transport
 
 
 @pytest.fixture
@@ -92,14 +161,72 @@ def sample_story():
     }
 
 
-@pytest.fixture
-def mock_anthropic_client():
-    """Mock Anthropic client for testing"""
-    mock_client = Mock()
-    mock_response = Mock()
-    mock_response.content = [Mock(text='{"epics": []}')]
-    mock_client.messages.create = Mock(return_value=mock_response)
-    return mock_client
+@pytest.fixture(scope="module")
+def sample_backlog_mixed_quality():
+    """One epic with a high-quality and a low-quality story (treat as read-only)"""
+    return {
+        "epics": [
+            {
+                "id": "EPIC-1",
+                "stories": [
+                    {
+                        "id": "EPIC-1-1",
+                        "acceptance_criteria": [
+                            "GIVEN user is logged in WHEN they submit THEN data is saved",
+                            "System validates input",
+                            "[Edge case]: Handles network error",
+                            "[Non-functional]: Performance < 1s",
+                            "User receives confirmation"
+                        ]
+                    },
+                    {
+                        "id": "EPIC-1-2",
+                        "acceptance_criteria": [
+                            "User can login",
+                            "System works"  # Low quality
+                        ]
+                    }
+                ]
+            }
+        ]
+    }
+
+
+@pytest.fixture(scope="module")
+def sample_backlog_multi_epic():
+    """Two epics with one story each, the second with too few criteria (treat as read-only)"""
+    return {
+        "epics": [
+            {
+                "id": "EPIC-1",
+                "stories": [
+                    {
+                        "id": "EPIC-1-1",
+                        "acceptance_criteria": [
+                            "GIVEN precondition WHEN action THEN result",
+                            "System validates data",
+                            "[Edge case]: Handles error",
+                            "[Non-functional]: Fast performance",
+                            "User gets feedback"
+                        ]
+                    }
+                ]
+            },
+            {
+                "id": "EPIC-2",
+                "stories": [
+                    {
+                        "id": "EPIC-2-1",
+                        "acceptance_criteria": [
+                            "Feature works",
+                            "User happy",
+                            "System stable"
+                        ]
+                    }
+                ]
+            }
+        ]
+    }
 
 
 @pytest.fixture
@@ -108,5 +235,5 @@ def mock_openai_client():
     mock_client = Mock()
     mock_response = Mock()
     mock_response.choices = [Mock(message=Mock(content='{"stories": []}'))]
-    mock_client.chat.completions.create = Mock(return_value=mock_response)
+    mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
     return mock_client
@@ -2,6 +2,8 @@
 API Endpoint Tests for StoryCrafter
 Tests all 4 granular tool endpoints
 """
+import asyncio
+import httpx
 import pytest
 from unittest.mock import patch, AsyncMock
 
@@ -9,241 +11,495 @@ from unittest.mock import patch, AsyncMock
 class TestHealthEndpoints:
     """Test health check endpoints"""
 
-    def test_root_endpoint(self, client):
-        """Test root endpoint returns healthy status"""
-        response = client.get("/")
+    @pytest.mark.parametrize("path,expected,required_keys", [
+        ("/", {"status": "healthy", "service": "StoryCrafter API"}, set()),
+        ("/health", {"status": "healthy"}, set()),
+        ("/test", {}, {"message", "anthropic_key_set", "openai_key_set"}),
+    ])
+    def test_health_endpoints(self, client, path, expected, required_keys):
+        """Test root, /health and /test endpoints return their status payload"""
+        response = client.get(path)
         assert response.status_code == 200
         data = response.json()
-        assert data["status"] == "healthy"
-        assert data["service"] == "StoryCrafter API"
+        assert expected.items() <= data.items()
+        assert required_keys <= data.keys()
 
-    def test_health_endpoint(self, client):
-        """Test /health endpoint"""
-        response = client.get("/health")
-        assert response.status_code == 200
-        data = response.json()
-        assert data["status"] == "healthy"
 
-    def test_test_endpoint(self, client):
-        """Test /test endpoint"""
-        response = client.get("/test")
-        assert response.status_code == 200
-        data = response.json()
-        assert "message" in data
-        assert "anthropic_key_set" in data
-        assert "openai_key_set" in data
+@pytest.fixture
+def clear_response_cache():
+    """Start and leave the test with an empty response cache"""
+    import index
+    index._response_cache.clear()
+    yield
+    index._response_cache.clear()
 
 
-class TestGenerateEpicsEndpoint:
-    """Test /generate-epics endpoint"""
+@pytest.fixture
+def mocked_service(request, monkeypatch):
+    """AsyncMock in place of the service method named by the (name, return_value) param"""
+    name, return_value = request.param
+    mock = AsyncMock(return_value=return_value)
+    monkeypatch.setattr(f"storycrafter_service.VISHKARStoryCrafterService.{name}", mock)
+    return mock
 
-    @patch('storycrafter_service.VISHKARStoryCrafterService.generate_epics')
-    @pytest.mark.asyncio
-    async def test_generate_epics_success(
+
+MOCK_EPICS = [{
+    "id": "EPIC-1",
+    "title": "Test Epic",
+    "description": "Test description",
+    "priority": "High",
+    "category": "MVP",
+    "story_count_target": 4
+}]
+MOCK_STORIES = [{
+    "id": "EPIC-1-1",
+    "title": "Test Story",
+    "description": "As a user, I want...",
+    "priority": "P0",
+    "story_points": 5
+}]
+MOCK_REGENERATED_EPIC = {
+    "id": "EPIC-1",
+    "title": "Updated Epic Title",
+    "regeneration_notes": "Updated based on feedback"
+}
+MOCK_REGENERATED_STORY = {
+    "id": "EPIC-1-1",
+    "title": "Updated Story Title",
+    "regeneration_notes": "Updated based on feedback"
+}
+
+
+@pytest.mark.usefixtures("clear_response_cache")
+class TestGranularEndpointsSuccess:
+    """Test the happy path of the 4 granular tool endpoints"""
+
+    @pytest.mark.parametrize("mocked_service,endpoint,request_fields,result_key,metadata,timestamp_key", [
+        (("generate_epics", MOCK_EPICS), "/generate-epics",
+         {"consensus_messages", "project_metadata"}, "epics", {"total_epics": 1}, "generated_at"),
+        (("generate_stories", MOCK_STORIES), "/generate-stories",
+         {"epic", "consensus_messages"}, "stories", {"total_stories": 1}, "generated_at"),
+        (("regenerate_epic", MOCK_REGENERATED_EPIC), "/regenerate-epic",
+         {"epic", "user_feedback", "consensus_messages"}, "epic", {}, "regenerated_at"),
+        (("regenerate_story", MOCK_REGENERATED_STORY), "/regenerate-story",
+         {"epic", "story", "user_feedback", "consensus_messages"}, "story", {}, "regenerated_at"),
+    ], indirect=["mocked_service"], ids=["generate_epics", "generate_stories", "regenerate_epic", "regenerate_story"])
+    def test_endpoint_success(
         self,
-        mock_generate_epics,
         client,
+        mocked_service,
+        endpoint,
+        request_fields,
+        result_key,
+        metadata,
+        timestamp_key,
+        sample_epic,
+        sample_story,
         sample_consensus_messages,
         sample_project_metadata
     ):
-        """Test successful epic generation"""
-        # Mock the service method
-        mock_epics = [
-            {
-                "id": "EPIC-1",
-                "title": "Test Epic",
-                "description": "Test description",
-                "priority": "High",
-                "category": "MVP",
-                "story_count_target": 4
-            }
-        ]
-        mock_generate_epics.return_value = mock_epics
+        """Test that each endpoint wraps its service result with success metadata"""
+        samples = {
+            "epic": sample_epic,
+            "story": sample_story,
+            "user_feedback": "Please update the title",
+            "consensus_messages": sample_consensus_messages,
+            "project_metadata": sample_project_metadata
+        }
 
-        # Make request
-        response = client.post(
-            "/generate-epics",
-            json={
-                "consensus_messages": sample_consensus_messages,
-                "project_metadata": sample_project_metadata
-            }
-        )
+        response = client.post(endpoint, json={field: samples[field] for field in request_fields})
 
-        # Assertions
         assert response.status_code == 200
         data = response.json()
         assert data["success"] is True
-        assert "epics" in data
-        assert "metadata" in data
-        assert data["metadata"]["total_epics"] == len(mock_epics)
+        assert data[result_key] == mocked_service.return_value
+        assert metadata.items() <= data["metadata"].items()
+        assert timestamp_key in data["metadata"]
+        mocked_service.assert_awaited_once()
 
-    def test_generate_epics_missing_messages(self, client):
-        """Test epic generation with missing consensus messages"""
-        response = client.post(
-            "/generate-epics",
-            json={}
-        )
-        assert response.status_code == 422  # Validation error
 
+class TestRequestValidation:
+    """Every granular endpoint rejects a body missing a required field"""
 
-class TestGenerateStoriesEndpoint:
-    """Test /generate-stories endpoint"""
+    @pytest.mark.parametrize("endpoint, fields, missing", [
+        ("/generate-epics", (), "consensus_messages"),
+        ("/generate-stories", ("consensus_messages",), "epic"),
+        ("/regenerate-epic", ("epic", "consensus_messages"), "user_feedback"),
+        ("/regenerate-story", ("epic", "user_feedback", "consensus_messages"), "story"),
+    ])
+    def test_missing_required_field_returns_422(
+        self, client, sample_epic, sample_consensus_messages, endpoint, fields, missing
+    ):
+        """Test the 422 response names the missing field"""
+        available = {
+            "epic": sample_epic,
+            "user_feedback": "Update it",
+            "consensus_messages": sample_consensus_messages,
+        }
+        response = client.post(endpoint, json={field: available[field] for field in fields})
 
-    @patch('storycrafter_service.VISHKARStoryCrafterService.generate_stories')
-    @pytest.mark.asyncio
-    async def test_generate_stories_success(
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["loc"] == ["body", missing]
+
+
+@pytest.mark.usefixtures("clear_response_cache")
+class TestGenerateBacklogEndpoint:
+    """Test /generate-backlog endpoint"""
+
+    @pytest.fixture
+    def mock_backlog(self):
+        """Minimal backlog in VISHKAR format"""
+        return {
+            "project": {"name": "Test App"},
+            "metadata": {
+                "total_epics": 1,
+                "total_stories": 0,
+                "total_estimated_hours": 0,
+                "generated_at": "2025-01-01T00:00:00Z"
+            },
+            "epics": [{"id": "EPIC-1", "title": "Test Epic", "stories": []}]
+        }
+
+    @patch('storycrafter_service.VISHKARStoryCrafterService.generate_from_consensus')
+    def test_generate_backlog_success(
         self,
-        mock_generate_stories,
+        mock_generate,
         client,
-        sample_epic,
+        mock_backlog,
         sample_consensus_messages
     ):
-        """Test successful story generation"""
-        # Mock the service method
-        mock_stories = [
-            {
-                "id": "EPIC-1-1",
-                "title": "Test Story",
-                "description": "As a user, I want...",
-                "priority": "P0",
-                "story_points": 5
-            }
-        ]
-        mock_generate_stories.return_value = mock_stories
+        """Test successful backlog generation"""
+        mock_generate.return_value = mock_backlog
 
-        # Make request
         response = client.post(
-            "/generate-stories",
-            json={
-                "epic": sample_epic,
-                "consensus_messages": sample_consensus_messages
-            }
+            "/generate-backlog",
+            json={"consensus_messages": sample_consensus_messages}
         )
 
-        # Assertions
         assert response.status_code == 200
         data = response.json()
         assert data["success"] is True
-        assert "stories" in data
-        assert data["metadata"]["total_stories"] == len(mock_stories)
+        assert data["backlog"]["epics"][0]["id"] == "EPIC-1"
+        assert data["metadata"]["total_epics"] == 1
+
+    @patch('storycrafter_service.VISHKARStoryCrafterService.generate_from_consensus')
+    def test_streamed_backlog_matches_generated_backlog(
+        self,
+        mock_generate,
+        client,
+        mock_backlog,
+        sample_consensus_messages
+    ):
+        """Test that the epic-by-epic encoded response is the full backlog"""
+        mock_backlog["epics"].append({"id": "EPIC-2", "title": "Second Epic", "stories": []})
+        mock_generate.return_value = mock_backlog
 
-    def test_generate_stories_missing_epic(self, client, sample_consensus_messages):
-        """Test story generation with missing epic"""
         response = client.post(
-            "/generate-stories",
+            "/generate-backlog",
             json={"consensus_messages": sample_consensus_messages}
         )
-        assert response.status_code == 422
-
 
-class TestRegenerateEpicEndpoint:
-    """Test /regenerate-epic endpoint"""
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert response.json()["backlog"] == mock_backlog
 
-    @patch('storycrafter_service.VISHKARStoryCrafterService.regenerate_epic')
-    @pytest.mark.asyncio
-    async def test_regenerate_epic_success(
+    @patch('storycrafter_service.VISHKARStoryCrafterService.generate_from_consensus')
+    def test_streamed_backlog_accepts_non_string_keys(
         self,
-        mock_regenerate_epic,
+        mock_generate,
         client,
-        sample_epic,
+        mock_backlog,
         sample_consensus_messages
     ):
-        """Test successful epic regeneration"""
-        # Mock the service method
-        mock_regenerated = {
-            **sample_epic,
-            "title": "Updated Epic Title",
-            "regeneration_notes": "Updated based on feedback"
-        }
-        mock_regenerate_epic.return_value = mock_regenerated
+        """Test that the streamed encoding accepts non-string keys like the other JSON endpoints"""
+        mock_backlog["project"]["story_points_by_priority"] = {0: 5}
+        mock_backlog["epics"][0]["hours_by_sprint"] = {1: 8}
+        mock_generate.return_value = mock_backlog
 
-        # Make request
         response = client.post(
-            "/regenerate-epic",
-            json={
-                "epic": sample_epic,
-                "user_feedback": "Please update the title",
-                "consensus_messages": sample_consensus_messages
-            }
+            "/generate-backlog",
+            json={"consensus_messages": sample_consensus_messages}
         )
 
-        # Assertions
         assert response.status_code == 200
-        data = response.json()
-        assert data["success"] is True
-        assert "epic" in data
-        assert "regenerated_at" in data["metadata"]
+        backlog = response.json()["backlog"]
+        assert backlog["project"]["story_points_by_priority"] == {"0": 5}
+        assert backlog["epics"][0]["hours_by_sprint"] == {"1": 8}
 
-    def test_regenerate_epic_missing_feedback(
+    @patch('storycrafter_service.VISHKARStoryCrafterService.generate_from_consensus')
+    def test_identical_requests_served_from_cache(
         self,
+        mock_generate,
         client,
-        sample_epic,
+        mock_backlog,
         sample_consensus_messages
     ):
-        """Test epic regeneration without feedback"""
-        response = client.post(
-            "/regenerate-epic",
-            json={
-                "epic": sample_epic,
-                "consensus_messages": sample_consensus_messages
-            }
-        )
-        assert response.status_code == 422
+        """Test that a retried request does not regenerate the backlog"""
+        mock_generate.return_value = mock_backlog
+        payload = {"consensus_messages": sample_consensus_messages}
 
+        first = client.post("/generate-backlog", json=payload)
+        second = client.post("/generate-backlog", json=payload)
 
-class TestRegenerateStoryEndpoint:
-    """Test /regenerate-story endpoint"""
+        assert first.json() == second.json()
+        assert mock_generate.call_count == 1
 
-    @patch('storycrafter_service.VISHKARStoryCrafterService.regenerate_story')
-    @pytest.mark.asyncio
-    async def test_regenerate_story_success(
+    @patch('storycrafter_service.VISHKARStoryCrafterService.generate_from_consensus')
+    def test_failed_generation_not_cached(
         self,
-        mock_regenerate_story,
+        mock_generate,
         client,
-        sample_epic,
-        sample_story,
+        mock_backlog,
         sample_consensus_messages
     ):
-        """Test successful story regeneration"""
-        # Mock the service method
-        mock_regenerated = {
-            **sample_story,
-            "title": "Updated Story Title",
-            "regeneration_notes": "Updated based on feedback"
-        }
-        mock_regenerate_story.return_value = mock_regenerated
+        """Test that errors are not cached so a retry can succeed"""
+        mock_generate.side_effect = [ValueError("bad consensus"), mock_backlog]
+        payload = {"consensus_messages": sample_consensus_messages}
+
+        assert client.post("/generate-backlog", json=payload).status_code == 400
+        assert client.post("/generate-backlog", json=payload).status_code == 200
+        assert mock_generate.call_count == 2
+
+
+@pytest.mark.usefixtures("clear_response_cache")
+class TestGenerateEpicsEndpoint:
+    """Test /generate-epics endpoint"""
 
-        # Make request
+    @patch('storycrafter_service.VISHKARStoryCrafterService.generate_epics')
+    def test_cached_epics_not_shared_across_api_keys(self, mock_generate_epics, client, sample_consensus_messages):
+        """Test that a cached result is only served to requests with the same API key"""
+        mock_generate_epics.return_value = MOCK_EPICS
+
+        for api_key in ("key-a", "key-b", "key-a"):
+            response = client.post("/generate-epics", json={
+                "consensus_messages": sample_consensus_messages,
+                "ai_provider": {"provider": "anthropic", "model": "claude", "api_key": api_key}
+            })
+            assert response.status_code == 200
+
+        assert mock_generate_epics.call_count == 2
+
+    def test_generate_epics_malformed_json(self, client):
+        """Test epic generation with a body that is not valid JSON"""
         response = client.post(
-            "/regenerate-story",
-            json={
-                "epic": sample_epic,
-                "story": sample_story,
-                "user_feedback": "Add more acceptance criteria",
-                "consensus_messages": sample_consensus_messages
-            }
+            "/generate-epics",
+            content=b'{"consensus_messages": [',
+            headers={"Content-Type": "application/json"}
         )
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["type"] == "json_invalid"
+
+    @patch('storycrafter_service.VISHKARStoryCrafterService.generate_epics')
+    def test_generate_epics_service_errors(self, mock_generate_epics, client):
+        """Test service errors map to 400 (ValueError) and 500 (anything else)"""
+        payload = {"consensus_messages": [{"role": "pm", "content": "Error mapping"}]}
+
+        mock_generate_epics.side_effect = ValueError("No consensus to work from")
+        response = client.post("/generate-epics", json=payload)
+        assert response.status_code == 400
+        assert response.json() == {"detail": "No consensus to work from"}
+
+        mock_generate_epics.side_effect = RuntimeError("upstream timeout")
+        response = client.post("/generate-epics", json=payload)
+        assert response.status_code == 500
+        assert response.json() == {"detail": "Epic generation failed: upstream timeout"}
+
+
+class TestStreamEpicsEndpoint:
+    """Test /generate-epics/stream endpoint"""
+
+    def test_stream_epics_sends_event_per_epic(self, client, sample_consensus_messages):
+        """Test that each epic is sent as its own event, followed by a done event"""
+        async def stream_epics(service, **kwargs):
+            yield {"id": "EPIC-1", "title": "Authentication"}
+            yield {"id": "EPIC-2", "title": "Offline Sync"}
+
+        with patch('storycrafter_service.VISHKARStoryCrafterService.stream_epics', new=stream_epics):
+            response = client.post(
+                "/generate-epics/stream",
+                json={"consensus_messages": sample_consensus_messages}
+            )
 
-        # Assertions
         assert response.status_code == 200
-        data = response.json()
-        assert data["success"] is True
-        assert "story" in data
-        assert "regenerated_at" in data["metadata"]
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+        assert [lines[0] for lines in events] == ["event: epic", "event: epic", "event: done"]
+        assert '"EPIC-2"' in events[1][1]
+        assert '"total_epics":2' in events[2][1]
 
-    def test_regenerate_story_missing_story(
+    def test_stream_epics_reports_failure_in_band(self, client, sample_consensus_messages):
+        """Test that a failure after streaming started is sent as an error event"""
+        async def stream_epics(service, **kwargs):
+            yield {"id": "EPIC-1", "title": "Authentication"}
+            raise RuntimeError("connection reset")
+
+        with patch('storycrafter_service.VISHKARStoryCrafterService.stream_epics', new=stream_epics):
+            response = client.post(
+                "/generate-epics/stream",
+                json={"consensus_messages": sample_consensus_messages}
+            )
+
+        assert response.text.strip().split("\n\n")[-1] == (
+            'event: error\ndata: {"detail":"Epic generation failed: connection reset"}'
+        )
+
+
+class TestGenerateStoriesEndpoint:
+    """Test /generate-stories endpoint"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_requests_coalesced(
         self,
-        client,
         sample_epic,
         sample_consensus_messages
     ):
-        """Test story regeneration without story"""
-        response = client.post(
-            "/regenerate-story",
-            json={
+        """Test that simultaneous duplicate requests share one generation"""
+        from index import app
+        calls = []
+
+        async def slow_generate_stories(service, **kwargs):
+            calls.append(kwargs)
+            await asyncio.sleep(0.05)
+            return [{"id": "EPIC-1-1", "title": "Test Story"}]
+
+        payload = {"epic": sample_epic, "consensus_messages": sample_consensus_messages}
+
+        with patch('storycrafter_service.VISHKARStoryCrafterService.generate_stories', new=slow_generate_stories):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                first, second = await asyncio.gather(
+                    ac.post("/generate-stories", json=payload),
+                    ac.post("/generate-stories", json=payload)
+                )
+
+        assert first.status_code == second.status_code == 200
+        assert first.json()["stories"] == second.json()["stories"]
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_requests_with_different_api_keys_not_coalesced(self, sample_epic, sample_consensus_messages):
+        """Test that simultaneous requests only share a generation when their credentials match"""
+        from index import app
+        calls = []
+
+        async def slow_generate_stories(service, **kwargs):
+            calls.append(kwargs)
+            await asyncio.sleep(0.05)
+            return [{"id": "EPIC-1-1", "title": "Test Story"}]
+
+        payloads = [
+            {
                 "epic": sample_epic,
-                "user_feedback": "Update story",
+                "consensus_messages": sample_consensus_messages,
+                "ai_provider": {"provider": "anthropic", "model": "claude", "api_key": api_key}
+            }
+            for api_key in ("key-a", "key-b")
+        ]
+
+        with patch('storycrafter_service.VISHKARStoryCrafterService.generate_stories', new=slow_generate_stories):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                responses = await asyncio.gather(*(ac.post("/generate-stories", json=p) for p in payloads))
+
+        assert [r.status_code for r in responses] == [200, 200]
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_first_caller_does_not_cancel_waiters(self):
+        """Test that a coalesced caller still gets the result when the caller that started it is cancelled"""
+        import index
+        release = asyncio.Event()
+        calls = []
+
+        async def produce():
+            calls.append(1)
+            await release.wait()
+            return ["story"]
+
+        first = asyncio.ensure_future(index._coalesced("coalesce-cancel", produce))
+        second = asyncio.ensure_future(index._coalesced("coalesce-cancel", produce))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+
+        assert await second == ["story"]
+        assert first.cancelled()
+        assert calls == [1]
+        assert "coalesce-cancel" not in index._inflight
+
+    @pytest.mark.asyncio
+    async def test_stories_for_same_consensus_batched(self, monkeypatch, sample_epic, sample_consensus_messages):
+        """Test that concurrent requests for different epics share one batched generation"""
+        import index
+        monkeypatch.setattr(index, "STORY_BATCH_WINDOW_MS", 20.0)
+        batches = []
+
+        async def generate_stories_batch(service, epics, **kwargs):
+            batches.append([epic["id"] for epic in epics])
+            return [[{"id": f"{epic['id']}-1", "title": "Story"}] for epic in epics]
+
+        payloads = [
+            {
+                "epic": {**sample_epic, "id": epic_id},
                 "consensus_messages": sample_consensus_messages
             }
-        )
-        assert response.status_code == 422
+            for epic_id in ("EPIC-1", "EPIC-2")
+        ]
+
+        with patch('storycrafter_service.VISHKARStoryCrafterService.generate_stories_batch', new=generate_stories_batch):
+            transport = httpx.ASGITransport(app=index.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                responses = await asyncio.gather(*(ac.post("/generate-stories", json=p) for p in payloads))
+
+        assert batches == [["EPIC-1", "EPIC-2"]]
+        assert [r.json()["stories"][0]["id"] for r in responses] == ["EPIC-1-1", "EPIC-2-1"]
+
+    @pytest.mark.asyncio
+    async def test_short_batch_result_fails_remaining_requests(self, monkeypatch, sample_epic, sample_consensus_messages):
+        """Test that a batch returning fewer results than epics fails the leftover requests instead of hanging"""
+        import index
+        monkeypatch.setattr(index, "STORY_BATCH_WINDOW_MS", 20.0)
+
+        async def generate_stories_batch(service, epics, **kwargs):
+            return [[{"id": f"{epics[0]['id']}-1", "title": "Story"}]]
+
+        payloads = [
+            {"epic": {**sample_epic, "id": epic_id}, "consensus_messages": sample_consensus_messages}
+            for epic_id in ("EPIC-1", "EPIC-2")
+        ]
+
+        with patch('storycrafter_service.VISHKARStoryCrafterService.generate_stories_batch', new=generate_stories_batch):
+            transport = httpx.ASGITransport(app=index.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                responses = await asyncio.wait_for(
+                    asyncio.gather(*(ac.post("/generate-stories", json=p) for p in payloads)), timeout=5
+                )
+
+        assert [r.status_code for r in responses] == [200, 500]
+
+    @pytest.mark.asyncio
+    async def test_stories_batched_per_api_key(self, monkeypatch, sample_epic, sample_consensus_messages):
+        """Test that requests with different API keys never share a batch (or its credentials)"""
+        import index
+        monkeypatch.setattr(index, "STORY_BATCH_WINDOW_MS", 20.0)
+        batches = []
+
+        async def generate_stories_batch(service, epics, **kwargs):
+            batches.append((service.anthropic_client.api_key, [epic["id"] for epic in epics]))
+            return [[{"id": f"{epic['id']}-1", "title": "Story"}] for epic in epics]
+
+        payloads = [
+            {
+                "epic": {**sample_epic, "id": epic_id},
+                "consensus_messages": sample_consensus_messages,
+                "ai_provider": {"provider": "anthropic", "model": "claude", "api_key": api_key}
+            }
+            for epic_id, api_key in (("EPIC-1", "key-a"), ("EPIC-2", "key-b"))
+        ]
+
+        with patch('storycrafter_service.VISHKARStoryCrafterService.generate_stories_batch', new=generate_stories_batch):
+            transport = httpx.ASGITransport(app=index.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                await asyncio.gather(*(ac.post("/generate-stories", json=p) for p in payloads))
+
+        assert sorted(batches) == [("key-a", ["EPIC-1"]), ("key-b", ["EPIC-2"])]